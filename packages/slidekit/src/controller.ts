@@ -1,4 +1,4 @@
-import SlideDeck, { SlideSpec, DomPlugin } from "./slidedeck";
+import SlideDeck, { SlideSpec, SharedSlides, DomPlugin, expandSharedSlides } from "./slidedeck";
 import PresenterNotes from "./presenternotes";
 import Timer from "./timer";
 import Canvas from "./canvas";
@@ -41,7 +41,7 @@ export default class Controller {
     private printSection: HTMLElement;
 
     constructor(
-        slides: SlideSpec[],
+        slides: SlideSpec[] | SharedSlides,
         root: HTMLDivElement,
         {
             duration,
@@ -52,6 +52,7 @@ export default class Controller {
             exitTransitions = [],
         }: Options
     ) {
+        slides = expandSharedSlides(slides);
         if (slides.length == 0) {
             throw new Error("Slide list is empty");
         }
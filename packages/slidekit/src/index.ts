@@ -1,5 +1,5 @@
 export { default as Controller } from "./controller";
-export { default as SlideDeck } from "./slidedeck";
+export { default as SlideDeck, expandSharedSlides } from "./slidedeck";
 export { default as PresenterNotes } from "./presenternotes";
 
 export { default as preprocessors } from "./preprocessors";
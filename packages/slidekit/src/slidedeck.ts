@@ -1,4 +1,44 @@
-export type SlideSpec = { id: string; content: string };
+export type SlideSpec = {
+    id: string;
+    content: string;
+    // Written by preprocess_slides.py: the build stages in the slide (before preprocessors like
+    // the stage squasher renumber them), and the ids of [move] elements that continue on the next slide
+    stages?: number[];
+    moves?: string[];
+};
+
+/**
+ * slides.json written with `--format shared`: subtrees that repeat across slides are stored once
+ * in `shared`, and the slides refer to them with <slidekit-shared ref="KEY"/>.
+ */
+export type SharedSlides = {
+    format: "slidekit-shared";
+    version: number;
+    shared: { [key: string]: string };
+    slides: SlideSpec[];
+};
+
+const sharedReference = /<slidekit-shared ref="([0-9a-f]+)"\/>/g;
+
+/**
+ * Put the shared subtrees back into the slides.
+ * Slide lists in the other formats are returned as they are.
+ */
+export function expandSharedSlides(slides: SlideSpec[] | SharedSlides): SlideSpec[] {
+    if (Array.isArray(slides)) {
+        return slides;
+    }
+    const { shared } = slides;
+    const expanded: { [key: string]: string } = {};
+    const expand = (content: string): string =>
+        content.replace(sharedReference, (_, key: string) => {
+            if (!(key in expanded)) {
+                expanded[key] = expand(shared[key]);
+            }
+            return expanded[key];
+        });
+    return slides.slides.map((slide) => ({ ...slide, content: expand(slide.content) }));
+}
 
 export type Step = {
     slide: Slide;
@@ -29,7 +69,8 @@ export default class SlideDeck {
     height: number;
     width: number;
 
-    constructor(slideList: SlideSpec[], plugins: DomPlugin[] = []) {
+    constructor(slideList: SlideSpec[] | SharedSlides, plugins: DomPlugin[] = []) {
+        slideList = expandSharedSlides(slideList);
         this.slides = [];
         this.steps = [];
 
@@ -0,0 +1,96 @@
+"""
+Cache of exported artboards for sketch2pdf.
+
+A .sketch file is a zip archive with one JSON file per page. Every artboard gets a key
+from the hash of its JSON, the symbol masters it uses (also through overrides and nested symbols),
+the images it refers to and the shared styles and foreign symbols in document.json.
+Exported SVGs are stored under that key, so a rebuild only has to export the artboards
+that changed, and copies the rest from the cache.
+"""
+
+import hashlib
+import json
+import zipfile
+from typing import List, Optional, Tuple
+
+# Bump this when sketchtool's export or the key computation changes
+ARTBOARD_CACHE_VERSION = 1
+
+# Parts of document.json that change without changing how artboards look
+VOLATILE_DOCUMENT_KEYS = {"currentPageIndex", "pages"}
+
+
+def index_artboards(sketch_file: str) -> Optional[List[Tuple[str, str, str]]]:
+    """(object ID, name, key) of every artboard in `sketch_file`, or None if it cannot be read as a .sketch archive."""
+    try:
+        with zipfile.ZipFile(sketch_file) as archive:
+            document = json.loads(archive.read("document.json"))
+            meta = json.loads(archive.read("meta.json"))
+            pages = [
+                json.loads(archive.read(name))
+                for name in sorted(archive.namelist())
+                if name.startswith("pages/") and name.endswith(".json")
+            ]
+            files = {info.filename: (info.CRC, info.file_size) for info in archive.infolist()}
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+    # Symbol masters are on the pages of the document, or copies of foreign symbols in document.json
+    symbols = {}
+    for value in _objects([document] + pages):
+        if value.get("_class") == "symbolMaster":
+            symbols[value["symbolID"]] = value
+
+    shared = {key: value for key, value in document.items() if key not in VOLATILE_DOCUMENT_KEYS}
+    prefix = hashlib.sha256(
+        _canonical([ARTBOARD_CACHE_VERSION, meta.get("appVersion"), meta.get("version"), shared])
+    ).digest()
+
+    artboards = []
+    for page in pages:
+        for layer in page.get("layers", []):
+            if layer.get("_class") == "artboard":
+                key = _artboard_key(prefix, layer, symbols, files)
+                artboards.append((layer["do_objectID"], layer["name"], key))
+    return artboards
+
+
+def _artboard_key(prefix: bytes, artboard: dict, symbols: dict, files: dict) -> str:
+    hasher = hashlib.sha256(prefix)
+    hasher.update(_canonical(artboard))
+    pending = [artboard]
+    used_symbols = set()
+    while pending:
+        for value in _objects(pending.pop()):
+            symbol_id = None
+            if value.get("_class") == "symbolInstance":
+                symbol_id = value.get("symbolID")
+            elif str(value.get("overrideName", "")).endswith("_symbolID"):
+                symbol_id = value.get("value")
+            if symbol_id in symbols and symbol_id not in used_symbols:
+                used_symbols.add(symbol_id)
+                hasher.update(_canonical(symbols[symbol_id]))
+                pending.append(symbols[symbol_id])
+
+            reference = value.get("_ref")
+            if isinstance(reference, str):
+                # Images are referenced with or without their extension
+                stored = files.get(reference) or files.get(reference + ".png")
+                hasher.update(f"{reference}:{stored}".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _objects(value):
+    """All JSON objects in `value`, including itself."""
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            yield value
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+
+
+def _canonical(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
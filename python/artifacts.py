@@ -0,0 +1,177 @@
+"""
+The artifact stage (`--artifacts`): build outputs in a form that servers and CDNs can cache forever.
+
+After a build, `ArtifactStore.update` takes the output files (the slides file, its shards and the media it uses) and
+
+- gives every file a content hash in its name: `slides.json` is copied to `slides.3f2a9c0d1e4b5a67.json`.
+  Shards and media files are already named after their content and are served as they are.
+- writes precompressed siblings next to the text files (`.gz`, and `.br` with the `brotli` package),
+  for servers that serve those directly (e.g. nginx's `gzip_static`). Files are compressed in parallel,
+  and only if their content changed since the previous build.
+- writes a manifest `<output name>.artifacts.json` next to the output, which maps logical names
+  (the names the slides and the shard manifest use) to the files to serve:
+
+    {
+     "format": "slidekit-artifacts",
+     "version": 1,
+     "artifacts": {
+      "slides.json": {"file": "slides.3f2a9c0d1e4b5a67.json", "sha256": ..., "bytes": 137650,
+                      "encodings": {"gzip": {"file": "slides.3f2a9c0d1e4b5a67.json.gz", "bytes": 21470}}},
+      "media/9a3e....png": {"file": "dist/media/9a3e....png", ...},
+      ...
+     }
+    }
+
+  Paths in `file` are relative to the manifest.
+- deletes the hashed copies and compressed files of earlier builds that are not part of this one.
+"""
+
+import hashlib
+import json
+import os
+
+from media import write_atomic
+
+ARTIFACTS_FORMAT = "slidekit-artifacts"
+ARTIFACTS_VERSION = 1
+MANIFEST_SUFFIX = ".artifacts.json"
+
+ENCODINGS = ["gzip", "br"]
+ENCODING_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+# Images are compressed already, compressing them again only costs time
+COMPRESSIBLE_EXTENSIONS = {".json", ".svg", ".xml", ".txt", ".html", ".css", ".js"}
+
+
+class ArtifactStore:
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, name + MANIFEST_SUFFIX)
+        self.previous = self._read_manifest(self.manifest_path)
+
+    def update(self, artifacts, encodings=("gzip",), jobs=1):
+        """
+        Hash, rename and compress the files of a build and write the manifest.
+        `artifacts` are (logical name, path, content addressed) tuples. Files that are not
+        content addressed get a copy with their hash in the name.
+        Returns the manifest.
+        """
+        if "br" in encodings:
+            try:
+                import brotli  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Brotli compression needs the `brotli` package.")
+
+        manifest = {"format": ARTIFACTS_FORMAT, "version": ARTIFACTS_VERSION, "artifacts": {}}
+        tasks = []
+        for name, path, content_addressed in artifacts:
+            known = self.previous["artifacts"].get(name, {})
+            stat = os.stat(path)
+            if known.get("stat") == [stat.st_size, stat.st_mtime_ns] and os.path.isfile(self._file(known["file"])):
+                sha256 = known["sha256"]
+            else:
+                sha256 = _sha256(path)
+
+            served = path
+            if not content_addressed:
+                stem, extension = os.path.splitext(path)
+                served = f"{stem}.{sha256[:16]}{extension}"
+                if not os.path.isfile(served):
+                    with open(path, "rb") as fp:
+                        write_atomic(served, fp.read())
+
+            entry = {
+                "file": self._relative(served),
+                "source": self._relative(path),
+                "sha256": sha256,
+                "bytes": stat.st_size,
+                "stat": [stat.st_size, stat.st_mtime_ns],
+                "encodings": {},
+            }
+            if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+                for encoding in encodings:
+                    compressed = served + ENCODING_SUFFIXES[encoding]
+                    previous = known.get("encodings", {}).get(encoding)
+                    if known.get("sha256") == sha256 and previous is not None and os.path.isfile(compressed):
+                        entry["encodings"][encoding] = previous
+                    else:
+                        tasks.append((name, encoding, served, compressed))
+            manifest["artifacts"][name] = entry
+
+        if tasks:
+            if jobs > 1 and len(tasks) > 1:
+                # zlib and brotli release the GIL while compressing
+                from concurrent.futures import ThreadPoolExecutor
+
+                with ThreadPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+                    sizes = list(executor.map(lambda task: compress_file(*task[1:]), tasks))
+            else:
+                sizes = [compress_file(*task[1:]) for task in tasks]
+            for (name, encoding, _, compressed), size in zip(tasks, sizes):
+                manifest["artifacts"][name]["encodings"][encoding] = {"file": self._relative(compressed), "bytes": size}
+        print(f"Compressed {len(tasks)} artifacts, {len(artifacts)} in the manifest.")
+
+        self._collect_garbage(manifest)
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+        self.previous = manifest
+        return manifest
+
+    def _collect_garbage(self, manifest):
+        """Delete the files that earlier builds wrote and this one does not use anymore."""
+        keep = set()
+        for entry in manifest["artifacts"].values():
+            keep.add(entry["file"])
+            keep.update(encoded["file"] for encoded in entry["encodings"].values())
+
+        for entry in self.previous["artifacts"].values():
+            # Only hashed copies and compressed files are ours, the sources belong to the build
+            written = [encoded["file"] for encoded in entry["encodings"].values()]
+            if entry["file"] != entry["source"]:
+                written.append(entry["file"])
+            for path in written:
+                if path not in keep and os.path.isfile(self._file(path)):
+                    os.unlink(self._file(path))
+
+    def _file(self, path):
+        return os.path.join(self.directory, path)
+
+    def _relative(self, path):
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.directory))
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(path, "r") as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get("format") != ARTIFACTS_FORMAT or manifest.get("version") != ARTIFACTS_VERSION:
+            manifest = {"artifacts": {}}
+        return manifest
+
+
+def compress_file(encoding, source, target):
+    """Write `source` compressed with `encoding` to `target` and return the compressed size."""
+    with open(source, "rb") as fp:
+        data = fp.read()
+    if encoding == "gzip":
+        import gzip
+
+        # mtime=0 so that the same content always compresses to the same bytes
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    elif encoding == "br":
+        import brotli
+
+        compressed = brotli.compress(data, quality=11)
+    else:
+        raise ValueError(f"Unknown encoding {encoding}")
+    write_atomic(target, compressed)
+    return len(compressed)
+
+
+def _sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for both processing pipelines, on a synthetic deck (see synthetic_deck.py).
+
+    python benchmark.py --slides 50 --save baseline.json
+    # ... change something ...
+    python benchmark.py --slides 50 --compare baseline.json
+
+Every benchmark runs `--repeat` times and the fastest run counts. One extra run under
+tracemalloc measures its peak memory. The startup benchmarks run in a new interpreter,
+so their peak memory is not measured. sketchtool and Chrome are replaced by stand-ins
+(the export copies the generated deck, rendering the PDF is skipped), so this runs offline.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+from argparse import ArgumentParser
+
+import preprocess_slides
+import sketch2pdf
+from synthetic_deck import add_deck_arguments, deck_options, generate_deck
+
+RESULTS_VERSION = 1
+
+SKETCHTOOL_STAND_IN = """#!{python}
+# Stand-in for `sketchtool export artboards FILE --output=DIR`: copies the synthetic deck
+import shutil, sys
+for argument in sys.argv[1:]:
+    if argument.startswith("--output="):
+        shutil.copytree({deck!r}, argument[len("--output="):], dirs_exist_ok=True)
+"""
+
+
+def main():
+    parser = ArgumentParser()
+    add_deck_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Also benchmark preprocessing with this many processes.")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these benchmarks.")
+    parser.add_argument("--save", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Compare with results saved earlier, and fail on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before --compare fails (0.2: 20%%).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="slides-benchmark-") as work_dir:
+        deck = os.path.join(work_dir, "deck")
+        generate_deck(deck, **deck_options(args))
+
+        benchmarks = get_benchmarks(deck, work_dir, args.jobs)
+        if args.only is not None:
+            benchmarks = {name: benchmarks[name] for name in args.only}
+
+        results = {
+            "version": RESULTS_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "commit": git_commit(),
+            "deck": deck_options(args),
+            "benchmarks": {},
+        }
+        for name, (setup, run) in benchmarks.items():
+            results["benchmarks"][name] = measure(setup, run, args.repeat)
+            print_result(name, results["benchmarks"][name])
+
+    if args.save is not None:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=1)
+        print(f"Results written to {args.save}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as fp:
+            baseline = json.load(fp)
+        if not compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+def get_benchmarks(deck, work_dir, jobs):
+    """Benchmarks by name, as (setup, run) pairs. `setup()` returns the arguments of one `run()`."""
+
+    def preprocess_setup():
+        run_dir = fresh_directory(os.path.join(work_dir, "preprocess"))
+        return os.path.join(run_dir, "slides.json"), os.path.join(run_dir, "dist")
+
+    def preprocess(**options):
+        def run(output, media_out_dir):
+            preprocess_slides.build_slides(deck, output, media_out_dir, **options)
+
+        return run
+
+    # Cache hits need the media files of the cached slides, so these runs share one output directory
+    cache_dir = os.path.join(work_dir, "cache")
+    cached_output = os.path.join(work_dir, "cached", "slides.json")
+    cached_media_out_dir = os.path.join(work_dir, "cached", "dist")
+
+    def cached_setup():
+        if not os.path.isdir(cache_dir):
+            fresh_directory(os.path.dirname(cached_output))
+            with quiet():
+                preprocess_slides.build_slides(deck, cached_output, cached_media_out_dir, cache_dir=cache_dir)
+        return cached_output, cached_media_out_dir
+
+    # sketch2pdf with stand-ins for sketchtool and Chrome
+    sketchtool = os.path.join(work_dir, "sketchtool")
+    with open(sketchtool, "w") as fp:
+        fp.write(SKETCHTOOL_STAND_IN.format(python=sys.executable, deck=deck))
+    os.chmod(sketchtool, 0o755)
+
+    def sketch2pdf_setup():
+        run_dir = fresh_directory(os.path.join(work_dir, "sketch2pdf"))
+        sketch_file = os.path.join(run_dir, "deck.sketch")
+        open(sketch_file, "w").close()
+        return (sketch2pdf.get_parser().parse_args([sketch_file, "--no_cache"]),)
+
+    def sketch2pdf_build(args):
+        original = sketch2pdf.SKETCHTOOL_BIN, sketch2pdf.render_pdf
+        sketch2pdf.SKETCHTOOL_BIN = sketchtool
+        sketch2pdf.render_pdf = lambda *_: None
+        try:
+            sketch2pdf.build_slides(args)
+        finally:
+            sketch2pdf.SKETCHTOOL_BIN, sketch2pdf.render_pdf = original
+
+    def stages_setup():
+        ElementTree.register_namespace("", "http://www.w3.org/2000/svg")
+        trees = []
+        for filename in sorted(os.listdir(deck)):
+            tree = ElementTree.parse(os.path.join(deck, filename)).getroot()
+            sketch2pdf.process_node(tree)
+            trees.append(tree)
+        return (trees,)
+
+    def stage_filtering(trees):
+        for tree in trees:
+            stages = sketch2pdf.StageIndex(tree)
+            for stage in stages.all_stages:
+                with stages.showing(stage):
+                    ElementTree.tostring(tree)
+
+    # Starting a fresh interpreter for a one-shot build: the imports,
+    # and for sketch2pdf the dependency check (which is cached after the first run)
+    probe_cache = os.path.join(work_dir, "probe-cache")
+
+    def startup(code):
+        def run():
+            subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+        return run
+
+    sketch2pdf_startup = (
+        f"import pathlib, sketch2pdf; sketch2pdf.SKETCHTOOL_BIN = {sketchtool!r}; "
+        f"sketch2pdf.check_dependencies(pathlib.Path({probe_cache!r}))"
+    )
+
+    benchmarks = {
+        "startup-preprocess": (lambda: (), startup("import preprocess_slides")),
+        "startup-sketch2pdf": (lambda: (), startup(sketch2pdf_startup)),
+        "preprocess": (preprocess_setup, preprocess()),
+        "preprocess-streaming": (preprocess_setup, preprocess(streaming=True)),
+        "preprocess-cached": (cached_setup, preprocess(cache_dir=cache_dir)),
+        "preprocess-shared": (preprocess_setup, preprocess(layout="shared")),
+        "preprocess-folded": (preprocess_setup, preprocess(fold_transforms=True)),
+        "sketch2pdf-build": (sketch2pdf_setup, sketch2pdf_build),
+        "sketch2pdf-stages": (stages_setup, stage_filtering),
+    }
+    if jobs > 1:
+        benchmarks[f"preprocess-j{jobs}"] = (preprocess_setup, preprocess(jobs=jobs))
+    return benchmarks
+
+
+def measure(setup, run, repeat):
+    """Time `run` `repeat` times and return the best and median time, and the peak memory of one more run."""
+    times = []
+    for _ in range(repeat):
+        arguments = setup()
+        with quiet():
+            start = time.perf_counter()
+            run(*arguments)
+            times.append(time.perf_counter() - start)
+
+    arguments = setup()
+    tracemalloc.start()
+    try:
+        with quiet():
+            run(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "median": statistics.median(times), "peak_bytes": peak}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the progress bars and messages of the builds."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def fresh_directory(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name, result):
+    print(
+        f"{name:<24} {result['seconds'] * 1000:9.1f} ms"
+        f"  (median {result['median'] * 1000:9.1f} ms)"
+        f"  peak {result['peak_bytes'] / (1 << 20):8.2f} MB"
+    )
+
+
+def compare(baseline, results, tolerance):
+    """Print how the results compare to the baseline. Returns False if a benchmark got slower than `tolerance` allows."""
+    if baseline.get("deck") != results["deck"]:
+        print("Warning: the baseline was measured on a different deck.")
+
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'} ({baseline.get('created')}):")
+    ok = True
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"{name:<24} (not in baseline)")
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        memory_ratio = result["peak_bytes"] / max(before["peak_bytes"], 1)
+        regression = ratio > 1 + tolerance
+        ok = ok and not regression
+        print(
+            f"{name:<24} {ratio:6.2f}x time  {memory_ratio:6.2f}x memory"
+            + ("  <-- slower" if regression else "")
+        )
+    return ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+A long-running build server for both scripts (`--serve`).
+
+Starting a build from scratch means starting Python, importing the dependencies, compiling
+the ID grammar and processing every slide. The daemon does all of that once, and keeps
+the processed slides in memory, so a build request only processes the slides that changed.
+Editor plugins and bundler transformers talk to it over a Unix socket; `--connect` does the
+same from the command line.
+
+Protocol: the client sends one JSON object and a newline, and receives one JSON object and a newline.
+
+    {"command": "build", "argv": ["slides", "-o", "slides.json"], "cwd": "/path/to/deck"}
+    -> {"ok": true, "seconds": 0.012, "log": "...", ...}
+    -> {"ok": false, "error": "...", "log": "..."}
+    {"command": "ping"}      -> {"ok": true, "pid": 1234, "builds": 5}
+    {"command": "shutdown"}  -> {"ok": true}
+
+`argv` are the script's command line arguments, relative to `cwd`. Builds run one at a time.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+DEFAULT_SOCKET = ".slides-daemon.sock"
+
+
+class BuildServer:
+    """Answers requests, see the protocol above. `serve()` connects it to a socket."""
+
+    def __init__(self, build):
+        """`build(argv)` runs one build and returns a dict of extra response fields."""
+        self.build = build
+        self.builds = 0
+        self.stopping = False
+        self._lock = threading.Lock()
+
+    def respond(self, message):
+        command = message.get("command")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid(), "builds": self.builds}
+        if command == "shutdown":
+            self.stopping = True
+            return {"ok": True}
+        if command == "build":
+            with self._lock:
+                return self._run_build(message["argv"], message.get("cwd"))
+        return {"ok": False, "error": f"Unknown command {command!r}"}
+
+    def _run_build(self, argv, cwd):
+        # The build's messages and progress bars go back to the client instead of the daemon's terminal
+        log = io.StringIO()
+        start = time.perf_counter()
+        previous_cwd = os.getcwd()
+        try:
+            os.chdir(cwd or previous_cwd)
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                response = dict(self.build(argv) or {}, ok=True)
+        except SystemExit as error:
+            # Invalid arguments, argparse has written the usage to the log
+            response = {"ok": False, "error": f"Exited with status {error.code}"}
+        except Exception as error:
+            log.write(traceback.format_exc())
+            response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+        finally:
+            os.chdir(previous_cwd)
+        self.builds += 1
+        response.update(seconds=time.perf_counter() - start, log=log.getvalue())
+        print(f"Build {self.builds} {'done' if response['ok'] else 'failed'} in {response['seconds'] * 1000:.0f} ms: {' '.join(argv)}")
+        return response
+
+
+def serve(socket_path, build):
+    """Run builds requested on `socket_path` until interrupted or asked to shut down."""
+    # Imported here, so that scripts which are not run as a daemon start faster
+    import socketserver
+
+    if os.path.exists(socket_path):
+        try:
+            send(socket_path, {"command": "ping"})
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        else:
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+    build_server = BuildServer(build)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                response = build_server.respond(json.loads(self.rfile.readline()))
+            except ValueError as error:
+                response = {"ok": False, "error": f"Invalid request: {error}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            if build_server.stopping:
+                # After answering, because shutting down ends the process
+                threading.Thread(target=self.server.shutdown).start()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    server = Server(socket_path, RequestHandler)
+    print(f"Waiting for builds on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def send(socket_path, message):
+    """Send one request to the daemon on `socket_path` and return its response."""
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as reader:
+            return json.loads(reader.readline())
+
+
+def request_build(socket_path, argv):
+    """Have the daemon build with the command line arguments `argv`, print its log and return an exit status."""
+    response = send(socket_path, {"command": "build", "argv": argv, "cwd": os.getcwd()})
+    sys.stdout.write(response.get("log", ""))
+    if not response["ok"]:
+        print(f"Build failed: {response['error']}", file=sys.stderr)
+        return 1
+    print(f"Built in {response['seconds'] * 1000:.0f} ms")
+    return 0
@@ -0,0 +1,37 @@
+"""
+A directory of files named after their keys, for the caches of sketch2pdf (artboards, pages).
+
+Files are written atomically, so concurrent builds never see half of one.
+`prune` deletes every file of the cache that a build did not use, so every cache
+directory must belong to a single deck.
+"""
+
+import os
+from typing import List
+
+from media import atomic_output
+
+
+class KeyedFileCache:
+    def __init__(self, directory: str, suffix: str):
+        self.directory = directory
+        self.suffix = suffix
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def has(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def store(self, file: str, key: str):
+        """Store a copy of `file` under `key`."""
+        with open(file, "rb") as source, atomic_output(self.path(key)) as fp:
+            fp.write(source.read())
+
+    def prune(self, keys: List[str]):
+        """Delete the files that are not in `keys`."""
+        keep = {f"{key}{self.suffix}" for key in keys}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.suffix) and filename not in keep:
+                os.unlink(os.path.join(self.directory, filename))
@@ -2,28 +2,228 @@
 
 """
 This script fills in gaps in sequences of images.
-You can use this when rendering videos.
+You can use this when rendering videos: renderers often only write a frame when
+something changed, and every missing frame shows the last frame before it.
+
+    python fill_in_gaps.py renders/ --pattern "frame%06d.png" --mode hardlink
+
+Missing frames can be hardlinks, symlinks or reflinks (copy-on-write clones) of the frame they repeat,
+so long static holds take no extra space. Real copies are written in parallel.
+Frames before the first rendered frame repeat the first rendered frame.
+
+Alternatively, `--concat list.txt` writes an ffmpeg concat list that shows every rendered frame
+for as long as it is held, so no frames are written at all:
+
+    ffmpeg -f concat -i list.txt -vsync vfr -pix_fmt yuv420p video.mp4
 """
 
+import errno
 import glob
-import shutil
+import os
 import re
+import shutil
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = ["copy", "hardlink", "symlink", "reflink", "auto"]
+
+# ioctl that clones a file on Linux file systems with copy-on-write support (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("directory", nargs="?", default=".", help="Directory with the rendered frames.")
+    parser.add_argument(
+        "--pattern",
+        default="frame%06d.png",
+        help="File names of the frames, with a printf-style frame number. Frames are found with any number of digits.",
+    )
+    parser.add_argument("--output-dir", "-o", default=None, help="Write the complete sequence here instead of into `directory`.")
+    parser.add_argument("--start", type=int, default=0, help="First frame of the sequence.")
+    parser.add_argument("--end", type=int, default=None, help="Last frame of the sequence (default: the last rendered frame).")
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        default="copy",
+        help="How missing frames are written. `auto` uses reflinks where the file system supports them, "
+        "then hardlinks, then copies.",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=4, help="Number of files written in parallel.")
+    parser.add_argument("--concat", default=None, help="Write an ffmpeg concat list to this file instead of filling in frames.")
+    parser.add_argument("--fps", type=float, default=30, help="Frame rate for the durations in `--concat`.")
+    args = parser.parse_args()
+
+    try:
+        frame_name, frame_regex = parse_pattern(args.pattern)
+    except ValueError as error:
+        parser.error(str(error))
+
+    frames = find_frames(args.directory, frame_regex)
+    if not frames:
+        sys.exit(f"No frames matching {args.pattern} in {args.directory}")
+    end = max(frames) if args.end is None else args.end
+    if end < args.start:
+        parser.error("--end is before --start")
+    plan = plan_frames(frames, args.start, end)
+
+    if args.concat is not None:
+        write_concat_list(args.concat, plan, frames, args.fps)
+        print(f"Wrote {args.concat} with {len(frames_in(plan))} distinct frames for {len(plan)} frames")
+        return
+
+    output_dir = args.output_dir or args.directory
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for frame_no, source_no in plan:
+        source = frames[source_no]
+        target = os.path.join(output_dir, frame_name % frame_no)
+        if not os.path.exists(target) or not os.path.samefile(source, target):
+            tasks.append((source, target))
+
+    write_frame = FRAME_WRITERS[args.mode]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            # list() re-raises the first error
+            list(executor.map(lambda task: write_frame(*task), tasks))
+    except OSError as error:
+        hint = " Try --mode auto." if args.mode in ("reflink", "hardlink") else ""
+        sys.exit(f"Cannot write {error.filename}: {error.strerror}.{hint}")
+    print(f"Wrote {len(tasks)} of {len(plan)} frames to {output_dir} ({args.mode})")
+
+
+def parse_pattern(pattern):
+    """
+    The format string and the regular expression for a pattern like `frame%06d.png`.
+    The regular expression matches the frame number with any number of digits.
+    """
+    placeholders = list(re.finditer(r"%(0?\d*)d", pattern))
+    if len(placeholders) != 1 or "%" in pattern.replace(placeholders[0].group(0), "", 1):
+        raise ValueError(f"The pattern needs exactly one frame number like %06d: {pattern}")
+    placeholder = placeholders[0]
+    prefix, suffix = pattern[: placeholder.start()], pattern[placeholder.end() :]
+    return pattern, re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix) + r"\Z")
+
+
+def find_frames(directory, frame_regex):
+    """Rendered frames in `directory` by frame number."""
+    frames = {}
+    for path in glob.glob(os.path.join(glob.escape(directory), "*")):
+        match = frame_regex.match(os.path.basename(path))
+        if match is not None:
+            frames[int(match.group(1))] = path
+    return frames
+
+
+def plan_frames(frames, start, end):
+    """
+    (frame number, rendered frame number to show) for every frame from `start` to `end`, inclusive.
+    Gaps repeat the last rendered frame before them, or the first rendered frame if there is none.
+    """
+    rendered = sorted(frames)
+    previous = next((frame_no for frame_no in reversed(rendered) if frame_no <= start), rendered[0])
+    plan = []
+    for frame_no in range(start, end + 1):
+        if frame_no in frames:
+            previous = frame_no
+        plan.append((frame_no, previous))
+    return plan
+
+
+def frames_in(plan):
+    """The rendered frames of a plan, in order, with the number of frames each of them is shown."""
+    holds = []
+    for _, source_no in plan:
+        if holds and holds[-1][0] == source_no:
+            holds[-1][1] += 1
+        else:
+            holds.append([source_no, 1])
+    return holds
+
+
+def write_concat_list(path, plan, frames, fps):
+    """Write an ffmpeg concat demuxer list that shows every rendered frame for as long as it is held."""
+    list_directory = os.path.dirname(os.path.abspath(path))
+
+    def file_line(source_no):
+        relative = os.path.relpath(os.path.abspath(frames[source_no]), list_directory)
+        return "file '" + relative.replace("'", "'\\''") + "'\n"
+
+    lines = ["ffconcat version 1.0\n"]
+    holds = frames_in(plan)
+    for source_no, count in holds:
+        lines.append(file_line(source_no))
+        lines.append(f"duration {count / fps:.6f}\n")
+    # ffmpeg ignores the duration of the last entry unless the file is listed once more
+    lines.append(file_line(holds[-1][0]))
+    with open(path, "w") as fp:
+        fp.writelines(lines)
+
+
+def replacing(write):
+    """Make a frame writer replace an existing file at the target, e.g. from an earlier run."""
+
+    def write_frame(source, target):
+        if os.path.lexists(target):
+            os.unlink(target)
+        write(source, target)
+
+    return write_frame
+
+
+def copy_frame(source, target):
+    shutil.copyfile(source, target)
+
+
+def hardlink_frame(source, target):
+    os.link(source, target)
+
+
+def symlink_frame(source, target):
+    os.symlink(os.path.relpath(os.path.abspath(source), os.path.dirname(os.path.abspath(target))), target)
+
+
+def reflink_frame(source, target):
+    """Clone `source` without copying its data. Raises OSError if the file system cannot do that."""
+    if sys.platform == "darwin":
+        # APFS clones with `cp -c`
+        if subprocess.run(["cp", "-c", source, target], capture_output=True).returncode != 0:
+            raise OSError(errno.EOPNOTSUPP, "Cannot clone files here", target)
+        return
+
+    import fcntl
+
+    with open(source, "rb") as source_fp, open(target, "wb") as target_fp:
+        try:
+            fcntl.ioctl(target_fp.fileno(), FICLONE, source_fp.fileno())
+        except OSError as error:
+            target_fp.close()
+            os.unlink(target)
+            raise OSError(error.errno, error.strerror, target) from None
+
+
+def auto_frame(source, target):
+    """Reflink, or else hardlink, or else copy."""
+    for write in (reflink_frame, hardlink_frame):
+        try:
+            write(source, target)
+            return
+        except OSError as error:
+            if error.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+    copy_frame(source, target)
 
-frame_dict = {}
 
-max_frame = 0
+FRAME_WRITERS = {
+    "copy": replacing(copy_frame),
+    "hardlink": replacing(hardlink_frame),
+    "symlink": replacing(symlink_frame),
+    "reflink": replacing(reflink_frame),
+    "auto": replacing(auto_frame),
+}
 
-for file in glob.glob("frame*.png"):
-    out = re.match(r"""frame(\d+).png""", file)
-    frameno = int(out[1])
-    frame_dict[frameno] = file
-    max_frame = max(max_frame, frameno)
 
-prev_match = 0
-for f in range(max_frame):
-    if f in frame_dict:
-        prev_match = f
-    else:
-        outfile = f"frame{f:06d}.png"
-        print("Writing", outfile)
-        shutil.copyfile(frame_dict[prev_match], outfile)
+if __name__ == "__main__":
+    main()
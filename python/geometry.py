@@ -0,0 +1,359 @@
+"""
+Helpers for rewriting SVG geometry.
+
+`optimize_attributes` is the optional geometry optimization of preprocess_slides (`--precision`):
+numbers are rounded to a fixed number of decimals, chains of transforms are collapsed
+(except on elements that a [move] animates, whose transforms are interpolated part by part),
+and path data is rewritten with the shorter of absolute and relative commands.
+The rounding error of coordinates stays within half a unit of the last decimal.
+"""
+
+import math
+import re
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+NUMBER = re.compile(_NUMBER)
+PLAIN_NUMBER = re.compile(rf"\s*{_NUMBER}\s*$")
+TRANSFORM_PART = re.compile(r"\s*(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)\s*,?")
+PATH_TOKEN = re.compile(rf"\s*,?\s*(?:([MmLlHhVvCcSsQqTtAaZz])|({_NUMBER}))")
+
+# Number of parameters of each path command
+PATH_PARAMETERS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+
+# Attributes that are rounded like coordinates
+COORDINATE_ATTRIBUTES = {"x", "y", "width", "height", "cx", "cy", "r", "rx", "ry", "x1", "y1", "x2", "y2", "font-size"}
+# Rounded like coordinates, but never to 0: a hairline of 0.5 would disappear with `--precision 0`
+NON_ZERO_ATTRIBUTES = {"stroke-width"}
+# Attributes whose values are ratios. A rounding error of 0.005 in a scale factor would move
+# points a thousand pixels out by 5 pixels, so these keep RATIO_EXTRA_DECIMALS more decimals.
+RATIO_ATTRIBUTES = {"opacity", "fill-opacity", "stroke-opacity"}
+RATIO_EXTRA_DECIMALS = 3
+TRANSFORM_ATTRIBUTES = {"transform", "gradientTransform", "patternTransform"}
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def polyline_to_path_data(points):
+    """Path data (`d` attribute) that draws the same line as a polyline's `points`."""
+    xy = points.split(" ")
+    xx = xy[::2]
+    yy = xy[1::2]
+    segments = [f"M{xx[0]} {yy[0]}"]
+    segments.extend(f"L{x} {y}" for x, y in zip(xx[1:], yy[1:]))
+    return " ".join(segments)
+
+
+def format_number(value, precision):
+    """`value` rounded to `precision` decimals, as short as possible: 0.50 -> `.5`, -0.0 -> `0`."""
+    text = f"{value:.{precision}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text.startswith("0."):
+        text = text[1:]
+    elif text.startswith("-0."):
+        text = "-" + text[2:]
+    if text == "-0":
+        text = "0"
+    return text
+
+
+def format_non_zero(value, precision):
+    """`value` like `format_number`, but positive values that would round to 0 become the smallest positive number."""
+    text = format_number(value, precision)
+    if text == "0" and value > 0:
+        text = format_number(10.0**-precision, precision)
+    return text
+
+
+def optimize_attributes(tag, attrs, precision):
+    """
+    Optimized copy of an element's attributes (a dict, the order is kept).
+    Attributes that have no effect after optimization (an identity transform) are left out.
+    """
+    optimized = {}
+    for key, value in attrs.items():
+        if key in COORDINATE_ATTRIBUTES and PLAIN_NUMBER.match(value):
+            value = format_number(float(value), precision)
+        elif key in NON_ZERO_ATTRIBUTES and PLAIN_NUMBER.match(value):
+            value = format_non_zero(float(value), precision)
+        elif key in RATIO_ATTRIBUTES and PLAIN_NUMBER.match(value):
+            value = format_number(float(value), precision + RATIO_EXTRA_DECIMALS)
+        elif key in TRANSFORM_ATTRIBUTES:
+            # The player interpolates the transforms of moving elements part by part, and finds
+            # the element they move to by its id alone. Those keep their parts, the others become a single matrix.
+            value = collapse_transform(value, precision, keep_parts="move" in attrs or bool(attrs.get("id")))
+            # preprocessors/scale.ts in slidekit appends to the existing transform
+            if value == "" and "scale" not in attrs:
+                continue
+        elif key == "d" and tag == "path":
+            value = optimize_path_data(value, precision)
+        elif key == "points" and tag == "polygon":
+            value = NUMBER.sub(lambda match: format_number(float(match.group()), precision), value)
+        optimized[key] = value
+    return optimized
+
+
+# Transforms
+
+
+def parse_transform(text):
+    """List of (name, [values]) of a transform attribute, or None if it can't be parsed."""
+    parts = []
+    position = 0
+    while position < len(text):
+        match = TRANSFORM_PART.match(text, position)
+        if match is None:
+            if text[position:].strip() == "":
+                break
+            return None
+        values = [float(value) for value in NUMBER.findall(match.group(2))]
+        parts.append((match.group(1), values))
+        position = match.end()
+    return parts
+
+
+def transform_matrix(name, values):
+    """The (a, b, c, d, e, f) matrix of a single transform function, or None for a wrong number of values."""
+    if name == "matrix" and len(values) == 6:
+        return tuple(values)
+    if name == "translate" and len(values) in (1, 2):
+        return (1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) == 2 else 0.0)
+    if name == "scale" and len(values) in (1, 2):
+        return (values[0], 0.0, 0.0, values[-1], 0.0, 0.0)
+    if name == "rotate" and len(values) in (1, 3):
+        angle = math.radians(values[0])
+        cos, sin = math.cos(angle), math.sin(angle)
+        rotation = (cos, sin, -sin, cos, 0.0, 0.0)
+        if len(values) == 1:
+            return rotation
+        cx, cy = values[1], values[2]
+        return multiply(multiply((1.0, 0.0, 0.0, 1.0, cx, cy), rotation), (1.0, 0.0, 0.0, 1.0, -cx, -cy))
+    if name == "skewX" and len(values) == 1:
+        return (1.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0, 0.0)
+    if name == "skewY" and len(values) == 1:
+        return (1.0, math.tan(math.radians(values[0])), 0.0, 1.0, 0.0, 0.0)
+    return None
+
+
+def multiply(m1, m2):
+    """The matrix of applying `m2` first and then `m1`, like `transform="m1 m2"`."""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + c1 * b2,
+        b1 * a2 + d1 * b2,
+        a1 * c2 + c1 * d2,
+        b1 * c2 + d1 * d2,
+        a1 * e2 + c1 * f2 + e1,
+        b1 * e2 + d1 * f2 + f1,
+    )
+
+
+def collapse_transform(text, precision, keep_parts=False):
+    """
+    A shorter transform attribute with the same effect: a single `translate()` or `matrix()`,
+    or "" for the identity. With `keep_parts`, only the numbers are rounded: every transform function stays,
+    with as many values as before, so that it still lines up with the parts of the transform it is interpolated with.
+    Transforms that can't be parsed are returned unchanged.
+    """
+    parts = parse_transform(text)
+    if parts is None or any(transform_matrix(name, values) is None for name, values in parts):
+        return text
+    if keep_parts:
+        ratio_precision = precision + RATIO_EXTRA_DECIMALS
+        formatted = []
+        for name, values in parts:
+            if name == "translate":
+                numbers = [format_number(value, precision) for value in values]
+            elif name == "matrix":
+                numbers = [format_number(value, ratio_precision) for value in values[:4]]
+                numbers += [format_number(value, precision) for value in values[4:]]
+            elif name == "rotate":
+                numbers = [format_number(values[0], ratio_precision)]
+                numbers += [format_number(value, precision) for value in values[1:]]
+            else:
+                numbers = [format_number(value, ratio_precision) for value in values]
+            formatted.append(f"{name}({','.join(numbers)})")
+        return " ".join(formatted)
+
+    matrix = IDENTITY
+    for name, values in parts:
+        matrix = multiply(matrix, transform_matrix(name, values))
+    return format_matrix(matrix, precision)
+
+
+def format_matrix(matrix, precision):
+    """The shortest transform attribute for a matrix: `translate()`, `matrix()` or "" for the identity."""
+    linear = [format_number(value, precision + RATIO_EXTRA_DECIMALS) for value in matrix[:4]]
+    translation = [format_number(value, precision) for value in matrix[4:]]
+    if linear == ["1", "0", "0", "1"]:
+        if translation == ["0", "0"]:
+            return ""
+        return f"translate({','.join(translation)})"
+    return f"matrix({','.join(linear + translation)})"
+
+
+# Path data
+
+
+def parse_path_data(d):
+    """List of (command, [values]) with one entry per segment, or None if `d` can't be parsed."""
+    segments = []
+    command = None
+    values = []
+    position = 0
+    while True:
+        match = PATH_TOKEN.match(d, position)
+        if match is None:
+            if d[position:].strip(" \t\r\n,") != "":
+                return None
+            break
+        position = match.end()
+        if match.group(1) is not None:
+            if command is not None and values:
+                return None
+            command = match.group(1)
+            if command in "Zz":
+                segments.append((command, []))
+        else:
+            if command is None or command in "Zz":
+                return None
+            # Arc flags are a single 0 or 1, they can be written without separators ("a1 1 0 01...")
+            if command in "Aa" and len(values) in (3, 4) and match.group(2) not in ("0", "1"):
+                return None
+            values.append(float(match.group(2)))
+            if len(values) == PATH_PARAMETERS[command.upper()]:
+                segments.append((command, values))
+                values = []
+                # Extra coordinate pairs after a moveto are linetos
+                if command == "M":
+                    command = "L"
+                elif command == "m":
+                    command = "l"
+    if values or not all(math.isfinite(value) for _, segment in segments for value in segment):
+        return None
+    return segments
+
+
+def optimize_path_data(d, precision):
+    """
+    Path data with rounded numbers, where every segment uses the shorter of its absolute
+    and relative form, and repeated commands are left out. Unparseable data is returned unchanged.
+    """
+    segments = parse_path_data(d)
+    if segments is None or not segments:
+        return d
+
+    output = []
+    previous_command = None
+    previous_number = ""
+    # The current point as the player computes it from the rounded output, and where the subpath started
+    x = y = start_x = start_y = 0.0
+    # The exact current point in the input
+    exact_x = exact_y = exact_start_x = exact_start_y = 0.0
+
+    for command, values in segments:
+        upper = command.upper()
+        relative = command != upper
+
+        if upper == "Z":
+            candidates = [("Z", [])]
+            x, y, exact_x, exact_y = start_x, start_y, exact_start_x, exact_start_y
+        else:
+            # Absolute coordinates of this segment in the input
+            absolute = list(values)
+            if upper == "H":
+                absolute = [values[0] + exact_x if relative else values[0]]
+            elif upper == "V":
+                absolute = [values[0] + exact_y if relative else values[0]]
+            elif upper == "A":
+                if relative:
+                    absolute[5] += exact_x
+                    absolute[6] += exact_y
+            elif relative:
+                for i in range(0, len(values), 2):
+                    absolute[i] += exact_x
+                    absolute[i + 1] += exact_y
+
+            end_x = absolute[0] if upper == "H" else (exact_x if upper == "V" else absolute[-2])
+            end_y = absolute[0] if upper == "V" else (exact_y if upper == "H" else absolute[-1])
+
+            candidates = []
+            for use_relative in (False, True):
+                offset_x, offset_y = (x, y) if use_relative else (0.0, 0.0)
+                if upper == "H":
+                    numbers = [format_number(absolute[0] - offset_x, precision)]
+                elif upper == "V":
+                    numbers = [format_number(absolute[0] - offset_y, precision)]
+                elif upper == "A":
+                    numbers = [format_number(value, precision) for value in absolute[:2]]
+                    numbers.append(format_number(absolute[2], precision + RATIO_EXTRA_DECIMALS))
+                    numbers += ["1" if absolute[3] else "0", "1" if absolute[4] else "0"]
+                    numbers += [
+                        format_number(absolute[5] - offset_x, precision),
+                        format_number(absolute[6] - offset_y, precision),
+                    ]
+                else:
+                    numbers = [
+                        format_number(value - (offset_x if i % 2 == 0 else offset_y), precision)
+                        for i, value in enumerate(absolute)
+                    ]
+                candidates.append((command_letter(upper, use_relative), numbers))
+
+                # A straight line that keeps one coordinate is shorter as a horizontal or vertical line
+                if upper == "L":
+                    if numbers[1] == (format_number(y - offset_y, precision)):
+                        candidates.append((command_letter("H", use_relative), numbers[:1]))
+                    elif numbers[0] == (format_number(x - offset_x, precision)):
+                        candidates.append((command_letter("V", use_relative), numbers[1:]))
+
+        # Pick the shortest way to write this segment
+        best = None
+        for letter, numbers in candidates:
+            implicit = letter == previous_command and letter not in "MmZz"
+            text = join_numbers(numbers, "" if not implicit else previous_number)
+            if not implicit:
+                text = letter + text
+            if best is None or len(text) < len(best[0]):
+                best = (text, letter, numbers)
+        text, letter, numbers = best
+        output.append(text)
+
+        # Where the player will be after this segment
+        if letter not in "Zz":
+            is_relative = letter.islower()
+            kind = letter.upper()
+            if kind == "H":
+                x = x + float(numbers[0]) if is_relative else float(numbers[0])
+            elif kind == "V":
+                y = y + float(numbers[0]) if is_relative else float(numbers[0])
+            else:
+                x = x + float(numbers[-2]) if is_relative else float(numbers[-2])
+                y = y + float(numbers[-1]) if is_relative else float(numbers[-1])
+            exact_x, exact_y = end_x, end_y
+            if upper == "M":
+                start_x, start_y, exact_start_x, exact_start_y = x, y, exact_x, exact_y
+
+        # After a moveto, a repeated pair of coordinates means lineto
+        previous_command = {"M": "L", "m": "l"}.get(letter, letter)
+        previous_number = numbers[-1] if numbers else ""
+
+    return "".join(output)
+
+
+def command_letter(command, relative):
+    return command.lower() if relative else command
+
+
+def join_numbers(numbers, previous=""):
+    """
+    Join numbers with as few separators as possible. `previous` is the number written
+    right before, if no command letter separates it from these numbers.
+    """
+    parts = []
+    for number in numbers:
+        if previous != "" and not (number.startswith("-") or number.startswith(".") and "." in previous):
+            parts.append(" ")
+        parts.append(number)
+        previous = number
+    return "".join(parts)
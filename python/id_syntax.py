@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""
+Parser for the ID syntax that annotates slide objects:
+
+    anythingblabla[attrkey=attrval][attrkey]
+
+The syntax is defined by the parsley grammar below. Building a parsley parser
+for every element is slow, so `parse_id` uses an equivalent regular expression
+and memoizes the results. Parsley is only used for IDs the fast path rejects,
+to raise the same errors as before.
+
+Run this file to check that both parsers agree.
+"""
+
+import functools
+import random
+import re
+
+ID_GRAMMAR_SOURCE = """
+id_char = anything:x ?(x not in '[]') -> x
+id = id_char+:string -> "".join(string)
+value_string = id
+attribute_key = (<letterOrDigit> | '-')+:string -> "".join(string)
+attribute_value = '=' value_string:value -> value
+attribute = '[' attribute_key:key attribute_value?:value ']' -> (key, value)
+syntax = id?:id attribute*:attributes -> {'id': id, 'attributes': attributes}
+"""
+
+# `[^\W_]` matches exactly the characters for which `str.isalnum()` holds,
+# which is what parsley's `letterOrDigit` checks.
+_ATTRIBUTE = r"\[((?:[^\W_]|-)+)(?:=([^\[\]]+))?\]"
+_SYNTAX_RE = re.compile(r"([^\[\]]*)((?:" + _ATTRIBUTE + r")*)\Z")
+_ATTRIBUTE_RE = re.compile(_ATTRIBUTE)
+
+
+def parse_id(id_attr):
+    """
+    Parse an ID into {'id': id or None, 'attributes': [(key, value or None), ...]},
+    the same structure the parsley grammar produces.
+    """
+    id_, attributes = _parse_id_cached(id_attr)
+    return {"id": id_, "attributes": list(attributes)}
+
+
+@functools.lru_cache(maxsize=8192)
+def _parse_id_cached(id_attr):
+    parsed = parse_id_fast(id_attr)
+    if parsed is None:
+        parsed = parse_id_grammar(id_attr)
+    return parsed["id"], tuple(parsed["attributes"])
+
+
+def parse_id_fast(id_attr):
+    """Regular-expression version of the grammar. Returns None if the ID does not match."""
+    match = _SYNTAX_RE.match(id_attr)
+    if match is None:
+        return None
+    return {
+        "id": match.group(1) or None,
+        "attributes": [(key, value or None) for key, value in _ATTRIBUTE_RE.findall(match.group(2))],
+    }
+
+
+def parse_id_grammar(id_attr):
+    """Reference implementation. Raises parsley's ParseError for malformed IDs."""
+    return _grammar()(id_attr).syntax()
+
+
+@functools.lru_cache(maxsize=None)
+def _grammar():
+    from parsley import makeGrammar
+
+    return makeGrammar(ID_GRAMMAR_SOURCE, {})
+
+
+DIFFERENTIAL_CORPUS = [
+    "",
+    "a",
+    "Template",
+    "100 Introduction",
+    "Introduction: a couple of squares",
+    "path-1",
+    "a[b]",
+    "a[b=c]",
+    "[b=c]",
+    "[stage=1]",
+    "box[stage=3-5][move]",
+    "mynode[move=1.5]",
+    "mynode[fade-in=0.5,1]",
+    "mynode[appear-along=PathId,5,0]",
+    "rect[youtube=55bjCP9Fy5I]",
+    "a[b=c=d]",
+    "a[b-c=1 2]",
+    "a[é=1]",
+    "a[x²]",
+    "a[b=c][d][e=f g]",
+    "a[b",
+    "a]",
+    "a[b=]",
+    "a[b c]",
+    "a[b]c",
+    "a[_x]",
+    "a[]",
+    "[",
+    "]",
+    "[[b]]",
+    "x[b=c]]",
+    "line\nbreak[a=1\n2]",
+]
+
+
+def check_against_grammar(corpus=DIFFERENTIAL_CORPUS, random_samples=2000, seed=0):
+    """
+    Compare `parse_id_fast` with the parsley grammar on `corpus` and on random IDs
+    built from the characters that matter to the syntax. Raises AssertionError on a mismatch.
+    """
+    rng = random.Random(seed)
+    alphabet = "ab1-_ =[]é²\n"
+    samples = list(corpus) + [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for _ in range(random_samples)
+    ]
+    for sample in samples:
+        try:
+            expected = parse_id_grammar(sample)
+        except Exception:
+            expected = None
+        actual = parse_id_fast(sample)
+        assert actual == expected, f"{sample!r}: fast parser gives {actual}, grammar gives {expected}"
+    return len(samples)
+
+
+if __name__ == "__main__":
+    print(f"Fast ID parser agrees with the grammar on {check_against_grammar()} IDs.")
@@ -0,0 +1,96 @@
+"""
+Helpers for writing the media files that are extracted from slides.
+"""
+
+import base64
+import binascii
+import contextlib
+import hashlib
+import os
+import secrets
+
+
+# Embedded images are hashed and decoded in pieces of this many characters,
+# so that large images are never held in memory more than once.
+CHUNK_SIZE = 1 << 20
+
+_BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+# b64decode discards characters outside of the alphabet (such as line breaks) before decoding
+_NOT_BASE64 = bytes(set(range(256)) - set(_BASE64_ALPHABET))
+
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    Open a temporary file in the directory of `path` for writing,
+    and move it to `path` once the block finishes without errors.
+    Media files are named after their content hash, so when several processes
+    write the same file at once, whoever renames last simply replaces identical bytes,
+    and readers never see a partially written file.
+    """
+    fd, tmp_path = _create_temporary_file(os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            yield fp
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _create_temporary_file(directory):
+    """
+    Create a new hidden file in `directory` and return its descriptor and path.
+    Unlike mkstemp's files, which only the owner can read, these get the permissions of
+    any new file (0o666 minus the umask), because they are served to browsers.
+    """
+    while True:
+        tmp_path = os.path.join(directory, f".{secrets.token_hex(8)}.tmp")
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def write_atomic(path, data):
+    """Write `data` to `path` through a temporary file (see `atomic_output`)."""
+    with atomic_output(path) as fp:
+        fp.write(data)
+
+
+def extract_data_uri(content, media_out_dir):
+    """
+    Write the payload of an embedded `data:` URI to `media_out_dir/media/<md5>.<ext>`
+    and return the path to use as `href` instead, relative to `media_out_dir`.
+    Payloads that were extracted before are not decoded again.
+    """
+    hash_object = hashlib.md5()
+    for start in range(0, len(content), CHUNK_SIZE):
+        hash_object.update(content[start : start + CHUNK_SIZE].encode("ascii"))
+    hexhash = hash_object.hexdigest()
+    data_start = content.index(",") + 1
+    slash_idx = content.index("/")
+    semicolon_idx = content.index(";")
+    extension = content[slash_idx + 1 : semicolon_idx]
+    filename = f"{hexhash}.{extension}"
+    filepath = os.path.join(media_out_dir, "media", filename)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    if not os.path.isfile(filepath):
+        with atomic_output(filepath) as fp:
+            decode_base64_to_file(content, data_start, fp)
+    return os.path.join("media", filename)
+
+
+def decode_base64_to_file(content, start, fp):
+    """Decode `content[start:]` into the binary file `fp`, one chunk at a time."""
+    remainder = b""
+    for chunk_start in range(start, len(content), CHUNK_SIZE):
+        chunk = content[chunk_start : chunk_start + CHUNK_SIZE].encode("ascii")
+        chunk = remainder + chunk.translate(None, _NOT_BASE64)
+        usable = len(chunk) - len(chunk) % 4
+        fp.write(binascii.a2b_base64(chunk[:usable]))
+        remainder = chunk[usable:]
+    if remainder:
+        # Raises the same 'Incorrect padding' error as decoding everything at once
+        fp.write(base64.b64decode(remainder))
@@ -0,0 +1,287 @@
+"""
+Bookkeeping for the images that are extracted from slides into `media_out_dir/media/`.
+
+After every build, `MediaStore.update` looks at the processed slides and
+
+- deduplicates images: extracted files are named after the hash of their data URI,
+  so the same image embedded with a different MIME type or line breaks is extracted twice.
+  References to such copies are rewritten to a single file.
+- optionally transcodes images (needs `Pillow`): downscales them to the size they are displayed at,
+  and/or re-encodes them to another format. This runs on a pool of worker processes, and
+  a transcoded image is only used if it is smaller than the original.
+- writes a manifest `media/<output name>.manifest.json` with the hash, size and referencing slides
+  of every file the slides use, and which extracted file each of them came from.
+- deletes the files that an earlier build of the same output produced but no slide uses anymore.
+  Files listed in the manifests of other outputs that share the media directory are kept.
+
+Extracted originals stay on disk next to their transcoded versions, so that cached slides
+(which refer to the originals) remain valid and images are not transcoded again.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import re
+
+from geometry import parse_transform, transform_matrix
+from media import write_atomic
+
+MANIFEST_FORMAT = "slidekit-media"
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+IMAGE_FORMATS = ["webp", "jpeg", "png"]
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+
+IMAGE_TAG = re.compile(r"<image\b([^>]*)>")
+ATTRIBUTE = re.compile(r'([\w:.-]+)="([^"]*)"')
+LENGTH = re.compile(r"\s*(\d+\.?\d*|\.\d+)(px)?\s*$")
+
+
+class MediaStore:
+    def __init__(self, media_out_dir, name):
+        self.media_out_dir = media_out_dir
+        self.media_dir = os.path.join(media_out_dir, "media")
+        self.manifest_path = os.path.join(self.media_dir, name + MANIFEST_SUFFIX)
+        os.makedirs(self.media_dir, exist_ok=True)
+        self.previous = self._read_manifest(self.manifest_path)
+        self._hashes = {}  # path -> [size, mtime_ns, sha256], stored in the manifest for the next build
+        self._variants = {}  # extracted path -> name of the transcoding settings used for it
+
+    def update(self, slide_ids, contents, image_density=None, image_format=None, image_quality=85, jobs=1):
+        """
+        Deduplicate and (if `image_density` or `image_format` is given) transcode the images
+        used by the slides, write the manifest and delete orphaned files.
+        Returns the slide contents with their references to the files that should be served.
+
+        `image_density` is the number of image pixels per displayed pixel to keep (e.g. 2 for high-DPI screens).
+        """
+        # Extracted files per slide, and the largest size each of them is displayed at
+        references = [image_references(content) for content in contents]
+        displayed = {}
+        for slide_references in references:
+            for path, size in slide_references:
+                displayed[path] = _larger(displayed.get(path, (0, 0)), size)
+        extracted = sorted(path for path in displayed if os.path.isfile(self._file(path)))
+
+        # Identical files are served once, from the first of their names
+        canonical = {}
+        first_with_hash = {}
+        for path in extracted:
+            digest = self._sha256(path)
+            canonical[path] = first_with_hash.setdefault(digest, path)
+            if canonical[path] != path:
+                displayed[canonical[path]] = _larger(displayed[canonical[path]], displayed[path])
+
+        served = {path: canonical[path] for path in extracted}
+        if image_density is not None or image_format is not None:
+            transcoded = self._transcode(sorted(set(canonical.values())), displayed, image_density, image_format, image_quality, jobs)
+            served = {path: transcoded[canonical[path]] for path in extracted}
+
+        contents = [
+            _rewrite_references(content, {path: served[path] for path, _ in slide_references if path in served})
+            for content, slide_references in zip(contents, references)
+        ]
+
+        manifest = {"format": MANIFEST_FORMAT, "version": MANIFEST_VERSION, "media": {}, "sources": {}}
+        for slide_id, slide_references in zip(slide_ids, references):
+            for path, _ in slide_references:
+                if path not in served:
+                    continue
+                entry = manifest["media"].setdefault(served[path], {"slides": []})
+                if slide_id not in entry["slides"]:
+                    entry["slides"].append(slide_id)
+        for path in manifest["media"]:
+            manifest["media"][path].update(self._describe(path))
+        for path in extracted:
+            manifest["sources"][path] = {"served": served[path], "variant": self._variants.get(path)}
+
+        self._collect_garbage(manifest)
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+        self.previous = manifest
+        return contents
+
+    def served_files(self):
+        """Paths of the media files that the slides use, relative to `media_out_dir`."""
+        return sorted(self.previous["media"])
+
+    def _transcode(self, paths, displayed, image_density, image_format, image_quality, jobs):
+        """Transcode the images at `paths` and return which file to serve for each."""
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Transcoding images needs the `Pillow` package.")
+
+        served = {}
+        tasks = []
+        for path in paths:
+            max_size = None
+            if image_density is not None and displayed[path] != (0, 0):
+                max_size = tuple(max(1, math.ceil(length * image_density)) for length in displayed[path])
+            variant = _variant_name(max_size, image_format, image_quality)
+            self._variants[path] = variant
+
+            known = self.previous["sources"].get(path, {})
+            if known.get("variant") == variant and os.path.isfile(self._file(known["served"])):
+                served[path] = known["served"]
+            else:
+                stem, extension = os.path.splitext(path)
+                target_extension = "." + EXTENSIONS[image_format] if image_format is not None else extension
+                target = f"{stem}-{variant}{target_extension}"
+                tasks.append((path, target, max_size))
+
+        if tasks:
+            arguments = [
+                (self._file(path), self._file(target), max_size, image_format, image_quality)
+                for path, target, max_size in tasks
+            ]
+            if jobs > 1 and len(tasks) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+                    results = list(executor.map(transcode_image, *zip(*arguments)))
+            else:
+                results = [transcode_image(*task) for task in arguments]
+            for (path, target, _), smaller in zip(tasks, results):
+                served[path] = target if smaller else path
+            print(f"Transcoded {sum(results)} of {len(tasks)} images.")
+        return served
+
+    def _describe(self, path):
+        """Hash and size of a served file."""
+        return {"sha256": self._sha256(path), "bytes": os.path.getsize(self._file(path))}
+
+    def _sha256(self, path):
+        # Hashes of files that did not change since the previous build are taken from its manifest
+        stat = os.stat(self._file(path))
+        known = self.previous.get("hashes", {}).get(path)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            self._hashes[path] = known
+            return known[2]
+        hasher = hashlib.sha256()
+        with open(self._file(path), "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                hasher.update(chunk)
+        self._hashes[path] = [stat.st_size, stat.st_mtime_ns, hasher.hexdigest()]
+        return hasher.hexdigest()
+
+    def _collect_garbage(self, manifest):
+        keep = set(manifest["media"]) | set(manifest["sources"])
+        for filename in os.listdir(self.media_dir):
+            path = os.path.join(self.media_dir, filename)
+            if filename.endswith(MANIFEST_SUFFIX) and path != self.manifest_path:
+                other = self._read_manifest(path)
+                keep |= set(other["media"]) | set(other["sources"])
+
+        previous = set(self.previous["media"]) | set(self.previous["sources"])
+        for path in previous - keep:
+            if os.path.isfile(self._file(path)):
+                os.unlink(self._file(path))
+
+        manifest["hashes"] = {path: self._hashes[path] for path in sorted(self._hashes) if path in keep}
+
+    def _file(self, path):
+        return os.path.join(self.media_out_dir, path)
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(path, "r") as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get("format") != MANIFEST_FORMAT or manifest.get("version") != MANIFEST_VERSION:
+            manifest = {"media": {}, "sources": {}}
+        return manifest
+
+
+def image_references(content):
+    """(href, (width, height)) of the extracted images in a processed slide, in the order they appear."""
+    references = []
+    for tag in IMAGE_TAG.finditer(content):
+        attributes = dict(ATTRIBUTE.findall(tag.group(1)))
+        href = attributes.get("href", "")
+        if href.startswith("media/"):
+            references.append((href, _displayed_size(attributes)))
+    return references
+
+
+def _displayed_size(attributes):
+    """
+    The size of an <image> in user units, including the scale of its own transform.
+    (0, 0) if it is unknown, or if the image may be stretched instead of scaled.
+    Transforms of moving groups around the image are not taken into account.
+    """
+    width = LENGTH.match(attributes.get("width", ""))
+    height = LENGTH.match(attributes.get("height", ""))
+    if width is None or height is None or "preserveAspectRatio" in attributes:
+        return (0, 0)
+    scale = 1.0
+    parts = parse_transform(attributes.get("transform", ""))
+    if parts is None:
+        return (0, 0)
+    for name, values in parts:
+        matrix = transform_matrix(name, values)
+        if matrix is None:
+            return (0, 0)
+        scale *= max(math.hypot(matrix[0], matrix[1]), math.hypot(matrix[2], matrix[3]))
+    return (float(width.group(1)) * scale, float(height.group(1)) * scale)
+
+
+def _larger(size_a, size_b):
+    # An unknown size means the image must not be downscaled
+    if size_a == (0, 0) and size_b == (0, 0):
+        return (0, 0)
+    if (size_a == (0, 0)) != (size_b == (0, 0)):
+        return (math.inf, math.inf)
+    return (max(size_a[0], size_b[0]), max(size_a[1], size_b[1]))
+
+
+def _variant_name(max_size, image_format, image_quality):
+    parts = []
+    if max_size is not None and all(math.isfinite(length) for length in max_size):
+        parts.append(f"{max_size[0]}x{max_size[1]}")
+    if image_format is not None:
+        parts.append(f"q{image_quality}")
+    return "-".join(parts) or "original"
+
+
+def _rewrite_references(content, served):
+    for path, target in served.items():
+        if target != path:
+            content = content.replace(f'href="{path}"', f'href="{target}"')
+    return content
+
+
+def transcode_image(source, target, max_size, image_format, quality):
+    """
+    Write a version of the image `source` to `target` that fits in `max_size` (if given),
+    encoded as `image_format` (or the original format). Returns whether it is smaller
+    than the source, otherwise nothing is written. Runs in worker processes.
+    """
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.load()
+        original_format = image.format
+        if max_size is not None and all(math.isfinite(length) for length in max_size):
+            if image.width > max_size[0] or image.height > max_size[1]:
+                image.thumbnail(max_size, Image.LANCZOS)
+        save_format = (image_format or original_format or "png").upper()
+        if save_format == "JPEG":
+            if image.mode in ("RGBA", "LA") or image.mode == "P" and "transparency" in image.info:
+                # JPEG has no transparency
+                return False
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        options = {"quality": quality} if save_format in ("JPEG", "WEBP") else {"optimize": True}
+        image.save(buffer, format=save_format, **options)
+
+    data = buffer.getvalue()
+    if len(data) >= os.path.getsize(source):
+        return False
+    write_atomic(target, data)
+    return True
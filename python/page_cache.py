@@ -0,0 +1,39 @@
+"""
+Cache of rendered PDF pages for sketch2pdf.
+
+Every stage SVG of a slide becomes one page of the PDF. Pages are stored as
+single-page PDFs named after the hash of the stage SVG, the page size and the renderer,
+so a rebuild only has to render the stages that changed, and splices the rest
+in from the cache. Splitting and merging pages needs `pypdf`.
+"""
+
+import hashlib
+from typing import List, Tuple
+
+from file_cache import KeyedFileCache
+from media import atomic_output
+
+
+class PageCache(KeyedFileCache):
+    def __init__(self, directory: str, renderer: str):
+        super().__init__(directory, ".pdf")
+        self.renderer = renderer
+
+    def key(self, svg_file: str, page_size: Tuple[int, int]) -> str:
+        hasher = hashlib.sha256(f"{self.renderer}\n{page_size[0]}x{page_size[1]}\n".encode("utf-8"))
+        with open(svg_file, "rb") as fp:
+            hasher.update(fp.read())
+        return hasher.hexdigest()
+
+    def store_pages(self, pdf_file: str, keys: List[str]):
+        """Split a freshly rendered PDF into pages, and store page i under keys[i]."""
+        from pypdf import PdfReader, PdfWriter
+
+        reader = PdfReader(pdf_file)
+        if len(reader.pages) != len(keys):
+            raise RuntimeError(f"Expected {len(keys)} pages in {pdf_file}, but it has {len(reader.pages)}.")
+        for page, key in zip(reader.pages, keys):
+            writer = PdfWriter()
+            writer.add_page(page)
+            with atomic_output(self.path(key)) as fp:
+                writer.write(fp)
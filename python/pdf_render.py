@@ -0,0 +1,74 @@
+"""
+Render HTML pages to PDF with headless Chrome, and merge PDF files.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+CHROME_LOCATIONS = [
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    "/Applications/Chromium.app/Contents/MacOS/Chromium",
+]
+CHROME_NAMES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"]
+
+
+def find_chrome(chrome_bin: Optional[str] = None) -> str:
+    """Locate a Chrome/Chromium binary: explicit argument, $CHROME_BIN, the macOS app bundles, or $PATH."""
+    if chrome_bin is None:
+        chrome_bin = os.environ.get("CHROME_BIN")
+    if chrome_bin is not None:
+        return chrome_bin
+    for location in CHROME_LOCATIONS:
+        if os.path.isfile(location):
+            return location
+    for name in CHROME_NAMES:
+        location = shutil.which(name)
+        if location is not None:
+            return location
+    raise FileNotFoundError("Could not find Chrome. Install it, or set $CHROME_BIN / --chrome.")
+
+
+def render_html_to_pdf(html_file: str, output_file: str, chrome_bin: str):
+    """Print one HTML file to PDF. Every call uses its own profile, so several can run at once."""
+    with tempfile.TemporaryDirectory(prefix="sketch2pdf-chrome-") as profile_dir:
+        command = [
+            chrome_bin,
+            "--headless",
+            "--disable-gpu",
+            f"--user-data-dir={profile_dir}",
+            f"--print-to-pdf={output_file}",
+        ]
+        if sys.platform.startswith("linux") and os.geteuid() == 0:
+            # Chrome refuses to start as root (e.g. in CI containers) with the sandbox enabled
+            command.append("--no-sandbox")
+        command.append(html_file)
+        subprocess.check_call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def merge_pdfs(pdf_files: List[str], output_file: str):
+    """Concatenate PDF files in order, with pypdf if it is installed, otherwise with pdfunite or qpdf."""
+    if len(pdf_files) == 1:
+        shutil.copyfile(pdf_files[0], output_file)
+        return
+
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        PdfWriter = None
+
+    if PdfWriter is not None:
+        writer = PdfWriter()
+        for pdf_file in pdf_files:
+            writer.append(pdf_file)
+        with open(output_file, "wb") as fp:
+            writer.write(fp)
+    elif shutil.which("pdfunite") is not None:
+        subprocess.check_call(["pdfunite"] + pdf_files + [output_file])
+    elif shutil.which("qpdf") is not None:
+        subprocess.check_call(["qpdf", "--empty", "--pages"] + pdf_files + ["--", output_file])
+    else:
+        raise RuntimeError("Merging PDFs needs the `pypdf` package, `pdfunite` or `qpdf`.")
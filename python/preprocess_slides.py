@@ -5,25 +5,45 @@ Run this script on a directory of SVD files
 to preprocess them and create one JSON that contains all your slides.
 """
 
-import base64
-import hashlib
-import json
 import os
-import time
+import sys
 import xml.dom
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+from functools import partial
 from glob import glob
+from itertools import repeat
 from xml.dom.minidom import parse
 
-from parsley import makeGrammar
-from tqdm import tqdm
-from watchdog.events import FileSystemEventHandler, FileSystemMovedEvent
-from watchdog.observers import Observer
-
-
-def main():
+import profiling
+import transform_folding
+from artifacts import ENCODINGS, ArtifactStore
+from build_daemon import DEFAULT_SOCKET, request_build, serve
+from geometry import optimize_attributes, polyline_to_path_data
+from id_syntax import ID_GRAMMAR_SOURCE, parse_id
+from media import extract_data_uri
+from media_store import IMAGE_FORMATS, MediaStore
+from slide_cache import SlideCache, fingerprint
+from slide_metadata import match_moves, scan_slide
+from slide_output import LAYOUTS, write_slides
+from svgstream import Unstreamable, process_svg_stream
+from watch import RebuildScheduler, check_cancelled, watch
+
+# Bump this whenever a change to the processing code changes the generated markup,
+# so that cached slides from older versions are not reused.
+PROCESSOR_VERSION = "0.4"
+
+
+def positive_int(text):
+    """An argparse type for counts that must be at least 1."""
+    value = int(text)
+    if value < 1:
+        raise ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def get_parser():
     parser = ArgumentParser()
-    parser.add_argument("slide_directory", help="Directory which contains SVGs for the slides.")
+    parser.add_argument("slide_directory", nargs="?", help="Directory which contains SVGs for the slides.")
     parser.add_argument("--output", "-o", default="slides.json")
     parser.add_argument(
         "--media-out-dir",
@@ -38,192 +58,599 @@ def main():
         default=False,
         help="Watch files in the slide directory for changes and auto-rebuild.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory for the incremental build cache, in a subdirectory per output file. "
+        "Defaults to `.slides-cache` next to the output file.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Re-process every slide instead of reusing unchanged slides from the cache.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of processes that process slides in parallel. Use 0 for one per CPU core.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        default=False,
+        help="Process slides while reading them instead of building a DOM, to use less memory on large slides.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=LAYOUTS,
+        default="json",
+        help="`json` writes one indented JSON file, `compact` leaves out the whitespace, "
+        "`sharded` writes a manifest to the output file and the slides to separate shard files, "
+        "`shared` stores subtrees that repeat across slides once.",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=positive_int,
+        default=1,
+        help="Number of slides per shard file, with `--format sharded`.",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=None,
+        help="Optimize the geometry for size: round numbers to this many decimals, collapse transforms "
+        "and write path data with relative commands where that is shorter.",
+    )
+    parser.add_argument(
+        "--fold-transforms",
+        action="store_true",
+        default=False,
+        help="Fold transforms into the coordinates of paths and polygons where that looks the same, "
+        "and collapse the other transform chains into a single matrix (see transform_folding.py).",
+    )
+    parser.add_argument(
+        "--image-density",
+        type=float,
+        default=None,
+        help="Downscale extracted images to this many pixels per pixel they are displayed at (e.g. 2 for high-DPI screens). "
+        "Needs the `Pillow` package.",
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=IMAGE_FORMATS,
+        default=None,
+        help="Re-encode extracted images in this format where that makes them smaller. Needs the `Pillow` package.",
+    )
+    parser.add_argument(
+        "--image-quality",
+        type=int,
+        default=85,
+        help="Quality (1-100) for `--image-format` webp and jpeg.",
+    )
+    parser.add_argument(
+        "--artifacts",
+        action="store_true",
+        default=False,
+        help="Also write the output and media files with content hashes in their names, compressed copies "
+        "for servers to serve as they are, and a manifest of them (see artifacts.py).",
+    )
+    parser.add_argument(
+        "--compression",
+        nargs="+",
+        choices=ENCODINGS,
+        default=["gzip"],
+        help="Compressed copies to write with `--artifacts`. `br` needs the `brotli` package.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile.json",
+        default=None,
+        help="Record the time and memory every slide and transform takes, and write a report to this file "
+        "(default: profile.json). Profiling makes the build slower.",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=profiling.FORMATS,
+        default="json",
+        help="`json` for a report with per-slide and per-transform totals, `chrome` for a trace for chrome://tracing.",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=DEFAULT_SOCKET,
+        default=None,
+        help=f"Run as a daemon that keeps processed slides in memory and builds on requests to this Unix socket "
+        f"(default: {DEFAULT_SOCKET}). See build_daemon.py for the protocol.",
+    )
+    parser.add_argument(
+        "--connect",
+        nargs="?",
+        const=DEFAULT_SOCKET,
+        default=None,
+        help=f"Let the daemon listening on this socket (default: {DEFAULT_SOCKET}) do the build.",
+    )
+    return parser
+
+
+def main():
+    parser = get_parser()
     args = parser.parse_args()
 
-    # create media directory
-    os.makedirs(os.path.join(args.media_out_dir, "media"), exist_ok=True)
+    if args.serve is not None:
+        serve(args.serve, partial(serve_build, parser, {}))
+        return
+    if args.slide_directory is None:
+        parser.error("the following arguments are required: slide_directory")
+    if args.connect is not None:
+        sys.exit(request_build(args.connect, sys.argv[1:]))
 
-    build_slides(args.slide_directory, args.output, args.media_out_dir)
+    options = build_options(args)
+    with profiling.profile_to(args.profile, args.profile_format):
+        build_slides(args.slide_directory, args.output, args.media_out_dir, **options)
 
     if args.watch:
-        observer = Observer()
-        observer.schedule(
-            WatchHandler(args.slide_directory, args.output, args.media_out_dir),
-            args.slide_directory,
-            recursive=True,
+
+        def rebuild(changed_paths, cancel):
+            with profiling.profile_to(args.profile, args.profile_format):
+                build_slides(
+                    args.slide_directory,
+                    args.output,
+                    args.media_out_dir,
+                    changed_paths=changed_paths,
+                    cancel=cancel,
+                    **options,
+                )
+
+        watch(args.slide_directory, RebuildScheduler(rebuild), lambda path: path.endswith(".svg"))
+
+
+def build_options(args):
+    """Keyword arguments for `build_slides` from the command line arguments."""
+    cache_dir = None
+    if not args.no_cache:
+        # Every build prunes the cache to the slides it used, so outputs must not share one
+        cache_dir = os.path.join(
+            args.cache_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), ".slides-cache"),
+            os.path.basename(args.output),
         )
-        observer.start()
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
+
+    jobs = args.jobs or os.cpu_count()
+
+    return dict(
+        cache_dir=cache_dir,
+        jobs=jobs,
+        streaming=args.streaming,
+        precision=args.precision,
+        fold_transforms=args.fold_transforms,
+        layout=args.format,
+        shard_size=args.shard_size,
+        image_density=args.image_density,
+        image_format=args.image_format,
+        image_quality=args.image_quality,
+        artifacts=args.artifacts,
+        compression=args.compression,
+    )
 
 
-def build_slides(slide_directory, output, media_out_dir):
+def serve_build(parser, memories, argv):
+    """
+    Run a build requested from the daemon. `memories` keeps the processed slides of every
+    deck and output between builds.
+    """
+    args = parser.parse_args(argv)
+    if args.slide_directory is None or args.watch or args.serve is not None:
+        raise ValueError("The daemon only runs single builds: pass a slide directory, without --watch or --serve.")
+
+    memory = memories.setdefault((os.path.abspath(args.slide_directory), os.path.abspath(args.output)), {})
+    with profiling.profile_to(args.profile, args.profile_format):
+        build_slides(args.slide_directory, args.output, args.media_out_dir, memory=memory, **build_options(args))
+    return {"output": os.path.abspath(args.output)}
+
+
+def build_slides(
+    slide_directory,
+    output,
+    media_out_dir,
+    cache_dir=None,
+    jobs=1,
+    streaming=False,
+    precision=None,
+    fold_transforms=False,
+    layout="json",
+    shard_size=1,
+    image_density=None,
+    image_format=None,
+    image_quality=85,
+    artifacts=False,
+    compression=("gzip",),
+    changed_paths=None,
+    cancel=None,
+    memory=None,
+):
+    """
+    Process all SVGs in `slide_directory` into one slides file.
+    Extracted images are deduplicated, optionally transcoded (see media_store.py)
+    and listed in a manifest next to them.
+    With `artifacts`, the output and media also get hashed names and `compression` encodings (see artifacts.py).
+    `memory` is a dict that keeps processed slides between the builds of a long-running process.
+    `changed_paths` are the files that changed since the previous build in this process, if known.
+    Setting the `cancel` event aborts the build with BuildCancelled.
+    """
+    os.makedirs(os.path.join(media_out_dir, "media"), exist_ok=True)
     files = sorted(glob(os.path.join(slide_directory, "*.svg")))
-    slide_list = []
+    contents = [None] * len(files)
+    scans = [None] * len(files)
+    if changed_paths is not None:
+        changed_paths = {os.path.abspath(path) for path in changed_paths}
+
+    # Slides whose source did not change since the last build are taken from the cache.
+    cache = None
+    cache_keys = {}
+    if cache_dir is not None or memory is not None:
+        cache = SlideCache(
+            cache_dir,
+            fingerprint(
+                PROCESSOR_VERSION,
+                ID_GRAMMAR_SOURCE,
+                {"streaming": streaming, "precision": precision, "fold_transforms": fold_transforms},
+            ),
+            memory,
+        )
+        for slide_no, slide_path in enumerate(files):
+            changed = changed_paths is None or os.path.abspath(slide_path) in changed_paths
+            cache_keys[slide_no] = cache.key(slide_path, changed=changed)
+            contents[slide_no], scans[slide_no] = cache.get(cache_keys[slide_no], media_out_dir) or (None, None)
 
     # We will go through all slides and
     # do a couple of modifications that makes the SVGs easier to work with
     #   for example, we inline 'use' statements
     #   and remove embedded images by paths to 'media/'
+    todo = [slide_no for slide_no, content in enumerate(contents) if content is None]
+    todo_paths = [files[slide_no] for slide_no in todo]
 
-    progress_bar = tqdm(enumerate(files), desc="Processing slides", unit=" slides")
-    for slide_no, slide_path in progress_bar:
-        progress_bar.set_postfix_str(slide_path)
-        doc = parse(slide_path)
+    process = process_slide
+    if profiling.enabled():
+        process = partial(profiling.run_profiled, process_slide)
 
-        process_node(doc, slide_no, root=doc, media_out_dir=media_out_dir)
-        slide_list.append(
-            {"id": os.path.splitext(os.path.basename(slide_path))[0], "content": doc.toxml()}
-        )
+    executor = None
+    arguments = (todo, todo_paths, repeat(media_out_dir), repeat(streaming), repeat(precision), repeat(fold_transforms))
+    if jobs > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
 
-    with open(output, "w") as fp:
-        json.dump(slide_list, fp, indent=1)
+        executor = ProcessPoolExecutor(max_workers=min(jobs, len(todo)))
+        results = executor.map(process, *arguments)
+    else:
+        results = map(process, *arguments)
+    if profiling.enabled():
+        results = profiling.collect(results)
+
+    from tqdm import tqdm
+
+    try:
+        progress_bar = tqdm(zip(todo, results), total=len(todo), desc="Processing slides", unit=" slides")
+        for slide_no, (content, media, scan) in progress_bar:
+            check_cancelled(cancel)
+            progress_bar.set_postfix_str(files[slide_no])
+            contents[slide_no] = content
+            scans[slide_no] = scan
+            if cache is not None:
+                cache.put(cache_keys[slide_no], content, media, scan)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    slide_ids = [os.path.splitext(os.path.basename(slide_path))[0] for slide_path in files]
+    with profiling.span("media store"):
+        media_store = MediaStore(media_out_dir, os.path.splitext(os.path.basename(output))[0])
+        contents = media_store.update(slide_ids, contents, image_density, image_format, image_quality, jobs)
+
+    slide_list = [
+        {
+            "id": slide_id,
+            "content": content,
+            "stages": scan["stages"],
+            "moves": match_moves(scan, next_scan),
+        }
+        for slide_id, content, scan, next_scan in zip(slide_ids, contents, scans, scans[1:] + [None])
+    ]
+
+    with profiling.span("write output"):
+        output_files = write_slides(slide_list, output, layout=layout, shard_size=shard_size)
+
+    if artifacts:
+        with profiling.span("artifacts"):
+            output_dir = os.path.dirname(os.path.abspath(output))
+            store = ArtifactStore(output_dir, os.path.splitext(os.path.basename(output))[0])
+            # The output is renamed, shards are named after their content already
+            named_files = [
+                (os.path.relpath(os.path.abspath(path), output_dir), path, path != output) for path in output_files
+            ]
+            named_files += [(path, os.path.join(media_out_dir, path), True) for path in media_store.served_files()]
+            store.update(named_files, compression, jobs)
+
+    if cache is not None:
+        cache.prune()
+        print(f"Re-used {cache.hits} cached slides, processed {cache.misses}.")
 
     print(f"Output written to {output}")
 
 
-ID_GRAMMAR = makeGrammar(
+def process_slide(slide_no, slide_path, media_out_dir, streaming=False, precision=None, fold_transforms=False):
+    """
+    Process a single SVG file.
+    Returns the processed markup, the media files it refers to and its metadata (see slide_metadata.py).
+    This runs in worker processes when building with several jobs.
+    """
+    with profiling.slide(slide_path):
+        result = None
+        if streaming:
+            try:
+                result = process_svg_stream(slide_path, slide_no, media_out_dir, precision)
+            except Unstreamable:
+                pass
+
+        if result is None:
+            with profiling.measure("parsing"):
+                doc = parse(slide_path)
+            process_node(doc, slide_no, root=doc, media_out_dir=media_out_dir)
+            if precision is not None:
+                with profiling.measure("geometry optimization"):
+                    optimize_geometry(doc, precision)
+            with profiling.measure("serialization"):
+                content = doc.toxml()
+            result = content, media_references(doc)
+            doc.unlink()
+
+        if fold_transforms:
+            with profiling.measure("transform folding"):
+                result = (transform_folding.fold_transforms(result[0], precision),) + result[1:]
+
+        with profiling.measure("metadata"):
+            scan = scan_slide(result[0])
+        return result + (scan,)
+
+
+def media_references(doc):
+    """Paths (relative to the media output directory) of the extracted images used in a slide."""
+    references = []
+    for image in elements_by_tag_name(doc, "image"):
+        href = image.getAttribute("href")
+        if href.startswith("media"):
+            references.append(href)
+    return references
+
+
+# Marks where process_node is done with the children of an element that pushed onto the id stack
+_POP_ID = object()
+
+
+def process_node(node, slide, root, media_out_dir, id_stack=None, definitions=None):
+    """
+    Apply all transforms to `node` and everything below it.
+
+    The tree is walked with an explicit stack instead of recursion, so deeply nested slides
+    don't hit Python's recursion limit. Every node is visited exactly once: the children of a
+    removed <g> are visited in their new place, and the elements a transform creates
+    (inlined <use> definitions, the <text>'s of split tspans) are not visited again.
+    `id_stack` holds the ids of the enclosing [move=true] elements. It is a single list that
+    is pushed and popped during the walk.
+    """
+    if definitions is None:
+        definitions = DefinitionIndex(root)
+    id_stack = list(id_stack or [])
+
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if node is _POP_ID:
+            id_stack.pop()
+            continue
+        is_element = node.nodeType == xml.dom.Node.ELEMENT_NODE
+
+        # Parse the ID syntax     anythingblabla[attrkey=attrval][attrkey=attrval]
+        if is_element:
+            with profiling.measure("id parsing"):
+                id_attr = node.getAttribute("id")
+                if id_attr is not None and id_attr != "":
+                    parsed = parse_id(id_attr)
+
+                    if parsed["id"] is not None:
+                        node.setAttribute("id", parsed["id"])
+                    else:
+                        node.setAttribute("id", "")
+
+                    for (key, value) in parsed["attributes"]:
+                        if value is None:
+                            value = ""
+                        node.setAttribute(key, value)
+
+                if node.getAttribute("move") == "true":
+                    id_stack.append(node.getAttribute("id"))
+                    node.setAttribute("id", "-".join(id_stack))
+                    pending.append(_POP_ID)
+
+        # Remove some <g> tags and more their children up in the hierarchy
+        # | To make transitioning of objects more reliable, we remove as many group tags that are
+        # | not meaningful for transitions.
+        # | Any group that is not moving from one slide to the next can be deleted from the DOM hierarchy.
+        if is_element and node.tagName == "g" and group_element_should_be_removed(node):
+            with profiling.measure("group flattening"):
+                parent = node.parentNode
+                children = list(node.childNodes)
+                for child in children:
+                    child = node.removeChild(child)
+                    parent.insertBefore(child, node)
+                    for attr in node.attributes.keys():
+                        apply_attr_to_groups_child(child, attr, node.getAttribute(attr))
+                parent.removeChild(node)
+                node.unlink()
+            pending.extend(reversed(children))
+            continue
+
+        # Inline 'use' statements
+        # This makes it easier to transition elements form one page to the next
+        # without worrying about breaking references.
+        if is_element and node.tagName == "use":
+            with profiling.measure("use inlining"):
+                definition = definitions.instantiate(node.getAttribute("xlink:href")[1:])
+                if definition is not None:
+                    for attribute in node.attributes.keys():
+                        if attribute != "xlink:href":
+                            definition.setAttribute(attribute, node.getAttribute(attribute))
+                    parent = node.parentNode
+                    parent.insertBefore(definition, node)
+                    node = parent.removeChild(node)
+                    node.unlink()
+            if definition is not None:
+                # The definition was processed where it is defined
+                continue
+
+        # Deal with <tspan>'s
+        # | Tspans don't support CSS transitions, so if a text entry has multiple tspan children,
+        # | we break them apart to their own <text> parent.
+        if is_element and node.tagName == "text" and "move" in node.attributes:
+            with profiling.measure("tspan splitting"):
+                textNode = node
+                i = 0
+                for child in list(textNode.childNodes):
+                    if child.nodeType == 1 and child.tagName == "tspan":
+                        i += 1
+                        tspanNode = child
+                        # create a new dom Element
+                        newText = node.cloneNode(False)
+                        tspanNode = textNode.removeChild(tspanNode)
+                        newText.appendChild(tspanNode)
+                        if "x" in tspanNode.attributes and "y" in tspanNode.attributes:
+                            x = float(tspanNode.getAttribute("x"))
+                            y = float(tspanNode.getAttribute("y"))
+                            tspanNode.removeAttribute("x")
+                            tspanNode.removeAttribute("y")
+                            newText.setAttribute("transform", f"translate({x},{y})")
+                            newText.setAttribute("id", newText.getAttribute("id") + "-" + str(i))
+                        textNode.parentNode.insertBefore(newText, textNode)
+                textNode = textNode.parentNode.removeChild(textNode)
+                textNode.unlink()
+            continue
+
+        # Replace polylines by "path" because they morph better
+        if is_element and node.tagName == "polyline":
+            with profiling.measure("polyline conversion"):
+                points = node.getAttribute("points")
+                node.tagName = "path"
+                node.removeAttribute("points")
+                node.setAttribute("d", polyline_to_path_data(points))
+
+        # Delete inline images, because they make the file too big
+        if (
+            is_element
+            and node.tagName == "image"
+            and node.getAttribute("xlink:href").startswith("data:")
+        ):
+            with profiling.measure("image extraction"):
+                href = extract_data_uri(node.getAttribute("xlink:href"), media_out_dir)
+                node.removeAttribute("xlink:href")
+                node.setAttribute("href", href)
+
+        pending.extend(reversed(node.childNodes))
+
+
+def optimize_geometry(doc, precision):
+    """Round numbers, collapse transforms and shorten path data in all elements, see `geometry.optimize_attributes`."""
+    for element in elements_by_tag_name(doc, "*"):
+        attrs = dict(element.attributes.items())
+        optimized = optimize_attributes(element.tagName, attrs, precision)
+        for key, value in attrs.items():
+            if key not in optimized:
+                element.removeAttribute(key)
+            elif optimized[key] != value:
+                element.setAttribute(key, optimized[key])
+
+
+def elements_by_tag_name(node, tag_name):
+    """
+    The elements below `node` with this tag name (or all for "*") in document order,
+    like `getElementsByTagName`, but without recursion.
+    """
+    elements = []
+    pending = list(reversed(node.childNodes))
+    while pending:
+        child = pending.pop()
+        if child.nodeType == xml.dom.Node.ELEMENT_NODE:
+            if tag_name == "*" or child.tagName == tag_name:
+                elements.append(child)
+            pending.extend(reversed(child.childNodes))
+    return elements
+
+
+class DefinitionIndex:
+    """
+    The direct children of all <defs> elements of a document, by id, for inlining <use>.
+
+    The index is built when the first <use> is found, so it contains the definitions
+    after they have been processed. Looking up an unknown id rebuilds it once.
+    For every definition we keep a prepared copy, without its id and with nested <use>'s
+    inlined, so repeated references to the same definition only need to clone that copy.
     """
-id_char = anything:x ?(x not in '[]') -> x
-id = id_char+:string -> "".join(string)
-value_string = id
-attribute_key = (<letterOrDigit> | '-')+:string -> "".join(string)
-attribute_value = '=' value_string:value -> value
-attribute = '[' attribute_key:key attribute_value?:value ']' -> (key, value)
-syntax = id?:id attribute*:attributes -> {'id': id, 'attributes': attributes}
-""",
-    {},
-)
-
-
-def process_node(node, slide, root, media_out_dir, id_stack=[]):
-    # Parse the ID syntax     anythingblabla[attrkey=attrval][attrkey=attrval]
-    if not node.nodeType in [
-        xml.dom.Node.TEXT_NODE,
-        xml.dom.Node.COMMENT_NODE,
-        xml.dom.Node.DOCUMENT_NODE,
-    ]:
-        id_attr = node.getAttribute("id")
-        if id_attr is not None and id_attr != "":
-            parsed = ID_GRAMMAR(id_attr).syntax()
-
-            if parsed["id"] is not None:
-                node.setAttribute("id", parsed["id"])
-            else:
-                node.setAttribute("id", "")
-
-            for (key, value) in parsed["attributes"]:
-                if value is None:
-                    value = ""
-                node.setAttribute(key, value)
-
-        if node.getAttribute("move") == "true":
-            id_stack = id_stack + [node.getAttribute("id")]
-            node.setAttribute("id", "-".join(id_stack))
-
-    # Remove some <g> tags and more their children up in the hierarchy
-    # | To make transitioning of objects more reliable, we remove as many group tags that are
-    # | not meaningful for transitions.
-    # | Any group that is not moving from one slide to the next can be deleted from the DOM hierarchy.
-    if node.nodeType == 1 and node.tagName == "g" and group_element_should_be_removed(node):
-        parent = node.parentNode
-        for child in list(node.childNodes):
-            # print("it has child", child)
-            child = node.removeChild(child)
-            child = parent.insertBefore(child, node)
-            for attr in node.attributes.keys():
-                apply_attr_to_groups_child(child, attr, node.getAttribute(attr))
-            process_node(child, slide, root, media_out_dir, id_stack=id_stack)
-        node = parent.removeChild(node)
-        node.unlink()
-        return
 
-    # Inline 'use' statements
-    # This makes it easier to transition elements form one page to the next
-    # without worrying about breaking references.
-    if node.nodeType == 1 and node.tagName == "use":
-        defs = root.getElementsByTagName("defs")[0]
-        ref_id = node.getAttribute("xlink:href")[1:]
-        parent = node.parentNode
-        for candidate in list(defs.childNodes):
-            if candidate.nodeType == 1 and candidate.getAttribute("id") == ref_id:
-                definition = candidate.cloneNode(True)
-                definition.removeAttribute("id")
-                for attribute in node.attributes.keys():
+    def __init__(self, root):
+        self.root = root
+        self._definitions = None
+        self._templates = {}
+        self._missing = set()
+
+    def instantiate(self, ref_id):
+        """A new copy of the definition with id `ref_id`, or None if there is no such definition."""
+        template = self._template(ref_id, resolving=set())
+        if template is None:
+            return None
+        return template.cloneNode(True)
+
+    def _lookup(self, ref_id):
+        if self._definitions is None or (
+            ref_id not in self._definitions and ref_id not in self._missing
+        ):
+            self._build()
+            if ref_id not in self._definitions:
+                self._missing.add(ref_id)
+        return self._definitions.get(ref_id)
+
+    def _build(self):
+        self._definitions = {}
+        self._templates = {}
+        for defs in elements_by_tag_name(self.root, "defs"):
+            for candidate in defs.childNodes:
+                if candidate.nodeType == 1:
+                    self._definitions.setdefault(candidate.getAttribute("id"), candidate)
+
+    def _template(self, ref_id, resolving):
+        if ref_id in self._templates:
+            return self._templates[ref_id]
+        candidate = self._lookup(ref_id)
+        if candidate is None or ref_id in resolving:
+            return None
+
+        template = candidate.cloneNode(True)
+        template.removeAttribute("id")
+
+        # Inline nested 'use' statements, unless they refer back to a definition we are inlining
+        resolving.add(ref_id)
+        for nested in elements_by_tag_name(template, "use"):
+            nested_template = self._template(nested.getAttribute("xlink:href")[1:], resolving)
+            if nested_template is not None:
+                definition = nested_template.cloneNode(True)
+                for attribute in nested.attributes.keys():
                     if attribute != "xlink:href":
-                        definition.setAttribute(attribute, node.getAttribute(attribute))
-                parent.insertBefore(definition, node)
-                node = parent.removeChild(node)
-                node.unlink()
-                break
-
-    # Deal with <tspan>'s
-    # | Tspans don't support CSS transitions, so if a text entry has multiple tspan children,
-    # | we break them apart to their own <text> parent.
-    if node.nodeType == 1 and node.tagName == "text" and "move" in node.attributes:
-        textNode = node
-        i = 0
-        for child in list(textNode.childNodes):
-            if child.nodeType == 1 and child.tagName == "tspan":
-                i += 1
-                tspanNode = child
-                # create a new dom Element
-                newText = node.cloneNode(False)
-                tspanNode = textNode.removeChild(tspanNode)
-                newText.appendChild(tspanNode)
-                if "x" in tspanNode.attributes and "y" in tspanNode.attributes:
-                    x = float(tspanNode.getAttribute("x"))
-                    y = float(tspanNode.getAttribute("y"))
-                    tspanNode.removeAttribute("x")
-                    tspanNode.removeAttribute("y")
-                    newText.setAttribute("transform", f"translate({x},{y})")
-                    newText.setAttribute("id", newText.getAttribute("id") + "-" + str(i))
-                textNode.parentNode.insertBefore(newText, textNode)
-        textNode = textNode.parentNode.removeChild(textNode)
-        textNode.unlink()
-
-    # Replace polylines by "path" because they morph better
-    if node.nodeType == 1 and node.tagName == "polyline":
-        points = node.getAttribute("points")
-        node.tagName = "path"
-        node.removeAttribute("points")
-        xy = points.split(" ")
-        xx = xy[::2]
-        yy = xy[1::2]
-        d = f"M{xx[0]} {yy[0]}"
-        for x, y in zip(xx[1:], yy[1:]):
-            d += f" L{x} {y}"
-        # d += " Z"
-        node.setAttribute("d", d)
-
-    # Delete inline images, because they make the file too big
-    if (
-        node.nodeType == 1
-        and node.tagName == "image"
-        and node.getAttribute("xlink:href").startswith("data:")
-    ):
-        content = node.getAttribute("xlink:href")
-        hash_object = hashlib.md5(content.encode("ascii"))
-        hexhash = hash_object.hexdigest()
-        data_start = content.index(",") + 1
-        slash_idx = content.index("/")
-        semicolon_idx = content.index(";")
-        extension = content[slash_idx + 1 : semicolon_idx]
-        filename = f"{hexhash}.{extension}"
-        filepath = os.path.join(media_out_dir, "media", filename)
-        os.makedirs(media_out_dir, exist_ok=True)
-        if not os.path.isfile(filepath):
-            with open(filepath, "wb") as fp:
-                fp.write(base64.b64decode(content[data_start:]))
-        node.removeAttribute("xlink:href")
-        node.setAttribute("href", os.path.join("media", filename))
-
-    for child in node.childNodes:
-        process_node(child, slide, root, media_out_dir, id_stack=id_stack)
+                        definition.setAttribute(attribute, nested.getAttribute(attribute))
+                nested.parentNode.replaceChild(definition, nested)
+                nested.unlink()
+        resolving.discard(ref_id)
+
+        self._templates[ref_id] = template
+        return template
 
 
 def group_element_should_be_removed(node):
@@ -263,23 +690,5 @@ def apply_attr_to_groups_child(node, attribute, value):
             node.setAttribute(attribute, value)
 
 
-class WatchHandler(FileSystemEventHandler):
-    def __init__(self, *args, **kwargs):
-        self.args = args
-        self.kwargs = kwargs
-        super().__init__()
-
-    def dispatch(self, event):
-        if event.src_path.endswith(".svg") or (
-            isinstance(event, FileSystemMovedEvent) and event.dest_path.endswith(".svg")
-        ):
-            output = self.args[1]
-            time_ago_modified = time.time() - os.path.getmtime(output)
-            if time_ago_modified > 1: ## 1 second
-                print(f"\n\nDetected change in {event.src_path}. Re-building Slide JSON.\n")
-                build_slides(*self.args, **self.kwargs)
-        return super().dispatch(event)
-
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,242 @@
+"""
+Opt-in build profiling for both scripts (`--profile`).
+
+Code marks the work it does in two ways:
+
+- `span(name)`: one event on the timeline, e.g. rendering a PDF batch
+- `slide(name)` and `measure(name)`: the time and memory a slide spends in each transform.
+  Transforms run once per node, so their measurements are summed up per slide instead of
+  becoming events of their own. Nested measurements only count towards the innermost one.
+
+All of them do nothing unless a profile is being recorded, so they can stay in hot code.
+Allocations are measured with tracemalloc, which makes a profiled build itself slower.
+It is only imported once a profile is recorded.
+
+The report is JSON, or a Chrome trace that can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+FORMATS = ["json", "chrome"]
+
+_NO_OP = contextlib.nullcontext()
+_profiler = None
+
+
+class Profiler:
+    def __init__(self):
+        import tracemalloc
+
+        self.events = []
+        self._transforms = None  # name -> [calls, seconds, allocated bytes] of the current slide
+        self._measuring = []  # stack of [start time, start memory, time in nested, memory in nested]
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    def close(self):
+        import tracemalloc
+
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        start_memory = _memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_event(name, "build", start, time.perf_counter() - start, _memory() - start_memory, args)
+
+    @contextlib.contextmanager
+    def slide(self, name):
+        import tracemalloc
+
+        self._transforms = {}
+        start_memory = _memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            transforms = {
+                transform: {"calls": calls, "seconds": seconds, "allocated": allocated}
+                for transform, (calls, seconds, allocated) in self._transforms.items()
+            }
+            args = {"transforms": transforms, "peak": tracemalloc.get_traced_memory()[1] - start_memory}
+            self._add_event(str(name), "slide", start, duration, _memory() - start_memory, args)
+            self._transforms = None
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        if self._transforms is None:
+            with self.span(name):
+                yield
+            return
+
+        entry = [time.perf_counter(), _memory(), 0.0, 0]
+        self._measuring.append(entry)
+        try:
+            yield
+        finally:
+            self._measuring.pop()
+            duration = time.perf_counter() - entry[0]
+            allocated = _memory() - entry[1]
+            if self._measuring:
+                self._measuring[-1][2] += duration
+                self._measuring[-1][3] += allocated
+            totals = self._transforms.setdefault(name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += duration - entry[2]
+            totals[2] += allocated - entry[3]
+
+    def _add_event(self, name, category, start, duration, allocated, args):
+        self.events.append(
+            {
+                "name": name,
+                "category": category,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "start": start,
+                "seconds": duration,
+                "allocated": allocated,
+                "args": args,
+            }
+        )
+
+    def report(self):
+        slides = [event for event in self.events if event["category"] == "slide"]
+        transforms = {}
+        for event in slides:
+            for transform, totals in event["args"]["transforms"].items():
+                combined = transforms.setdefault(transform, {"calls": 0, "seconds": 0.0, "allocated": 0})
+                for key in combined:
+                    combined[key] += totals[key]
+        return {
+            "slides": [_summarize(event) for event in slides],
+            "spans": [_summarize(event) for event in self.events if event["category"] != "slide"],
+            "transforms": transforms,
+        }
+
+    def chrome_trace(self):
+        origin = min((event["start"] for event in self.events), default=0.0)
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": event["category"],
+                "ph": "X",
+                "ts": (event["start"] - origin) * 1e6,
+                "dur": event["seconds"] * 1e6,
+                "pid": event["pid"],
+                "tid": event["tid"],
+                "args": dict(event["args"], allocated=event["allocated"]),
+            }
+            for event in self.events
+        ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def _memory():
+    import tracemalloc
+
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _summarize(event):
+    summary = {"name": event["name"], "seconds": event["seconds"], "allocated": event["allocated"]}
+    summary.update(event["args"])
+    return summary
+
+
+def enabled():
+    return _profiler is not None
+
+
+def span(name, **args):
+    """Record the code in this block as one event."""
+    return _NO_OP if _profiler is None else _profiler.span(name, **args)
+
+
+def slide(name):
+    """Record the code in this block as the processing of one slide."""
+    return _NO_OP if _profiler is None else _profiler.slide(name)
+
+
+def measure(name):
+    """Add the time and memory of this block to the current slide's total for transform `name`."""
+    return _NO_OP if _profiler is None else _profiler.measure(name)
+
+
+@contextlib.contextmanager
+def profile_to(path, format="json", top=10):
+    """Profile the code in this block, then write the report to `path` and print a summary. No-op if `path` is None."""
+    global _profiler
+    if path is None:
+        yield
+        return
+
+    _profiler = Profiler()
+    try:
+        yield
+    finally:
+        profiler, _profiler = _profiler, None
+        profiler.close()
+        data = profiler.chrome_trace() if format == "chrome" else profiler.report()
+        with open(path, "w") as fp:
+            json.dump(data, fp, indent=1)
+        print_summary(profiler.report(), top)
+        print(f"Profile written to {path}")
+
+
+def run_profiled(function, *args):
+    """
+    Call `function(*args)` while recording a profile, and return its result with the recorded events.
+    Pool workers run slides this way. Pass the results through `collect()` in the main process.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    first = len(_profiler.events)
+    result = function(*args)
+    events = _profiler.events[first:]
+    del _profiler.events[first:]
+    return result, events
+
+
+def collect(results):
+    """Unwrap the results of `run_profiled`, and add their events to this process's profile."""
+    for result, events in results:
+        _profiler.events.extend(events)
+        yield result
+
+
+def print_summary(report, top=10):
+    def megabytes(size):
+        return f"{size / (1 << 20):8.2f} MB"
+
+    print(f"\nSlowest slides (of {len(report['slides'])}):")
+    for entry in sorted(report["slides"], key=lambda entry: entry["seconds"], reverse=True)[:top]:
+        transforms = entry["transforms"]
+        slowest = max(transforms, key=lambda transform: transforms[transform]["seconds"], default="-")
+        print(
+            f"  {entry['seconds'] * 1000:9.1f} ms  peak {megabytes(entry['peak'])}"
+            f"  slowest transform: {slowest:<20}  {entry['name']}"
+        )
+
+    print("Time per transform, all slides:")
+    for transform, totals in sorted(report["transforms"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+        print(
+            f"  {totals['seconds'] * 1000:9.1f} ms  {megabytes(totals['allocated'])}"
+            f"  {totals['calls']:8} calls  {transform}"
+        )
+
+    if report["spans"]:
+        print("Build steps:")
+    for entry in report["spans"]:
+        print(f"  {entry['seconds'] * 1000:9.1f} ms  {entry['name']}")
@@ -0,0 +1,120 @@
+"""
+Deck-wide deduplication of repeated SVG subtrees, for the `shared` output layout.
+
+Slides repeat a lot of markup: logos, footers, backgrounds, and elements that stay on screen
+while a slide is copied and changed into the next one. `share_subtrees` hashes the markup of every
+element in every slide and stores each subtree that occurs more than once (and is big enough to be
+worth it) once, in a table of shared subtrees. Where it occurred, the slides get a reference:
+
+    <slidekit-shared ref="3f2a9c0d1e4b5a67"/>
+
+The key is the hash of the subtree's markup, which is the same for the same subtree in every slide
+because both processing pipelines write the same canonical markup (minidom's serialization).
+Shared subtrees can refer to smaller shared subtrees in turn. Of nested repeated subtrees,
+the outermost one is shared.
+
+`expand_shared` puts the markup back. The expanded slides are identical to the ones in the other layouts.
+"""
+
+import bisect
+import hashlib
+import re
+from xml.parsers import expat
+
+# Replacing smaller subtrees saves less than the reference and the table entry cost
+MIN_SHARED_BYTES = 128
+
+REFERENCE_TAG = "slidekit-shared"
+REFERENCE_PATTERN = re.compile(f'<{REFERENCE_TAG} ref="([0-9a-f]+)"/>')
+
+
+def share_subtrees(contents):
+    """
+    Deduplicate the markup of a list of slides.
+    Returns the contents with references, and the shared subtrees by key (which may contain references).
+    """
+    slides = []
+    counts = {}
+    for content in contents:
+        data = content.encode("utf-8")
+        spans = []
+        for start, end in _element_spans(data):
+            if end - start >= MIN_SHARED_BYTES:
+                key = hashlib.sha256(data[start:end]).hexdigest()[:16]
+                spans.append((start, end, key))
+                counts[key] = counts.get(key, 0) + 1
+        slides.append((data, spans))
+
+    shared = {}
+    shared_contents = []
+    for data, spans in slides:
+        spans = [span for span in spans if counts[span[2]] > 1]
+        starts = [start for start, _, _ in spans]
+        shared_contents.append(_replace(data, spans, starts, 0, len(data), shared).decode("utf-8"))
+    return shared_contents, {key: markup.decode("utf-8") for key, markup in shared.items()}
+
+
+def expand_shared(content, shared, expanded=None):
+    """
+    The markup of a slide with shared subtrees put back in.
+    `expanded` caches expanded subtrees by key; pass the same dict for all slides of a deck.
+    """
+    if expanded is None:
+        expanded = {}
+
+    def expand(match):
+        key = match.group(1)
+        if key not in expanded:
+            expanded[key] = expand_shared(shared[key], shared, expanded)
+        return expanded[key]
+
+    return REFERENCE_PATTERN.sub(expand, content)
+
+
+def _replace(data, spans, starts, start, end, shared):
+    """
+    `data[start:end]` with every outermost shared subtree in it replaced by a reference,
+    except for an element spanning all of it. Adds the shared subtrees to `shared`.
+    """
+    parts = []
+    position = start
+    for index in range(bisect.bisect_left(starts, start), len(spans)):
+        span_start, span_end, key = spans[index]
+        if span_start >= end:
+            break
+        if span_start < position or (span_start == start and span_end == end):
+            # Inside a subtree that was just replaced, or the shared subtree itself
+            continue
+        parts.append(data[position:span_start])
+        parts.append(f'<{REFERENCE_TAG} ref="{key}"/>'.encode("utf-8"))
+        position = span_end
+        if key not in shared:
+            shared[key] = _replace(data, spans, starts, span_start, span_end, shared)
+    parts.append(data[position:end])
+    return b"".join(parts)
+
+
+def _element_spans(data):
+    """(start, end) byte offsets of the markup of every element in `data`, in document order."""
+    spans = []
+    open_elements = []
+
+    def start_element(tag, attributes):
+        open_elements.append(len(spans))
+        spans.append([parser.CurrentByteIndex, None])
+
+    def end_element(tag):
+        span = spans[open_elements.pop()]
+        position = parser.CurrentByteIndex
+        if data.startswith(b"</", position):
+            span[1] = data.index(b">", position) + 1
+        else:
+            # An empty-element tag `<tag .../>`, expat reports it at its start.
+            # `>` is escaped in attribute values, so the first one ends the tag.
+            span[1] = data.index(b">", span[0]) + 1
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(data, True)
+    return [tuple(span) for span in spans]
@@ -1,22 +1,28 @@
 import os
 import argparse
-import copy
+import contextlib
+import hashlib
+import json
 import pathlib
 import re
 import shutil
 import subprocess
-import time
-from typing import List, Tuple
+import sys
+from functools import partial
+from itertools import repeat
+from typing import List, Optional, Tuple
 import tempfile
-import xml.dom
 import xml.etree.ElementTree as ElementTree
-import uuid
-from xml.dom.minidom import parse
 
-import tqdm
-from parsley import makeGrammar
-from watchdog.events import FileModifiedEvent, FileSystemEventHandler
-from watchdog.observers import Observer
+import profiling
+from artboard_cache import index_artboards
+from build_daemon import DEFAULT_SOCKET, request_build, serve
+from file_cache import KeyedFileCache
+from id_syntax import parse_id
+from media import write_atomic
+from page_cache import PageCache
+from pdf_render import find_chrome, merge_pdfs, render_html_to_pdf
+from watch import RebuildScheduler, check_cancelled, watch
 
 
 SKETCHTOOL_DEFAULT_LOCATION = "/Applications/Sketch.app/Contents/Resources/sketchtool/bin/sketchtool"
@@ -29,43 +35,80 @@ else:
 def get_parser():
     parser = argparse.ArgumentParser()
     # fmt: off
-    parser.add_argument("sketch_file", help="Sketch containing the slides")
+    parser.add_argument("sketch_file", nargs="?", help="Sketch containing the slides")
     parser.add_argument("--use_svg_convert", action="store_true", help="Use svg-convert instead of chrome for conversion")
     parser.add_argument("--no_build_stage", action="store_true", help="Disable slides transitions")
     parser.add_argument("--no_cleanup", action="store_true", help="Disable tmp files cleanup for debugging")
     parser.add_argument("--no_page_number", action="store_true", help="Disable page numbering")
     parser.add_argument("--watch", "-w", action="store_true", help="Watch changes of sketch_file and auto-rebuild.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes that process slides in parallel (0: one per CPU core)")
+    parser.add_argument("--render_jobs", type=int, default=1, help="Number of Chrome processes that render PDF pages in parallel")
+    parser.add_argument("--batch_size", type=int, default=0, help="Number of slide stages per Chrome process (default: split evenly over --render_jobs)")
+    parser.add_argument("--no_cache", action="store_true", help="Export every artboard and render every page instead of re-using unchanged ones from the cache")
+    parser.add_argument("--cache_dir", default=None, help="Directory for cached artboards and pages, in a subdirectory per .sketch file (default: .sketch2pdf-cache next to sketch_file)")
+    parser.add_argument("--chrome", default=None, help="Path to the Chrome binary (default: $CHROME_BIN, or search the usual locations)")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None, help="Record the time and memory of every slide, transform and render step, and write a report to this file (default: profile.json)")
+    parser.add_argument("--profile_format", choices=profiling.FORMATS, default="json", help="json: per-slide and per-transform totals, chrome: a trace for chrome://tracing")
+    parser.add_argument("--serve", nargs="?", const=DEFAULT_SOCKET, default=None, help=f"Run as a daemon that keeps processed slides in memory and builds on requests to this Unix socket (default: {DEFAULT_SOCKET})")
+    parser.add_argument("--connect", nargs="?", const=DEFAULT_SOCKET, default=None, help=f"Let the daemon listening on this socket (default: {DEFAULT_SOCKET}) do the build")
     # fmt: on
     return parser
 
 
 def main():
-    check_dependencies()
     parser = get_parser()
     args = parser.parse_args()
-
-    build_slides(args)
+    if args.connect is not None and args.sketch_file is not None:
+        # The daemon has the dependencies
+        sys.exit(request_build(args.connect, sys.argv[1:]))
+
+    if args.serve is not None:
+        check_dependencies()
+        serve(args.serve, partial(serve_build, parser, {}))
+        return
+    if args.sketch_file is None:
+        parser.error("the following arguments are required: sketch_file")
+    check_dependencies(None if args.no_cache else get_cache_dir(args))
+    args.jobs = args.jobs or os.cpu_count()
+
+    with profiling.profile_to(args.profile, args.profile_format):
+        build_slides(args)
 
     if args.watch:
         sketch_file = pathlib.Path(args.sketch_file)
-        observer = Observer()
-        handler = WatchHandler(lambda: build_slides(args), sketch_file.name)
-        observer.schedule(
-            handler,
-            path=sketch_file.parent,
+        print(f"Watching changes in {args.sketch_file}...")
+        # A save of the sketch file often fires several events, they are coalesced into one rebuild
+        def rebuild(changed_paths, cancel):
+            with profiling.profile_to(args.profile, args.profile_format):
+                build_slides(args, cancel)
+
+        scheduler = RebuildScheduler(rebuild)
+        watch(
+            sketch_file.parent,
+            scheduler,
+            lambda path: os.path.basename(path) == sketch_file.name,
             recursive=False,
         )
-        observer.start()
-        try:
-            print(f"Watching changes in {args.sketch_file}...")
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
 
 
-def build_slides(args):
+def serve_build(parser, memories, argv):
+    """Run a build requested from the daemon. `memories` keeps the processed slides of every sketch file between builds."""
+    args = parser.parse_args(argv)
+    if args.sketch_file is None or args.watch or args.serve is not None:
+        raise ValueError("The daemon only runs single builds: pass a sketch file, without --watch or --serve.")
+    args.jobs = args.jobs or os.cpu_count()
+
+    memory = memories.setdefault(os.path.abspath(args.sketch_file), {})
+    with profiling.profile_to(args.profile, args.profile_format):
+        build_slides(args, memory=memory)
+    return {"output": os.path.abspath(pathlib.Path(args.sketch_file).with_suffix(".pdf"))}
+
+
+def build_slides(args, cancel=None, memory=None):
+    """
+    Export, process and render the slides of args.sketch_file. Setting `cancel` aborts with BuildCancelled.
+    `memory` is a dict that keeps processed slides between the builds of a long-running process.
+    """
     sketch_file = pathlib.Path(args.sketch_file)
     slides_directory = sketch_file.parent / "tmp"
     slides_directory.mkdir(exist_ok=True)
@@ -73,51 +116,61 @@ def build_slides(args):
     processed_directory.mkdir(exist_ok=True)
 
     print("Generate SVG files")
-    subprocess.run([SKETCHTOOL_BIN, "export", "artboards", "--formats=svg", sketch_file, f"--output={slides_directory}"])
+    export_artboards(args, sketch_file, slides_directory)
 
     print("Process SVG files")
     files = sorted(list(slides_directory.glob("*.svg")))
 
-    ElementTree.register_namespace("", "http://www.w3.org/2000/svg")
+    # Slides whose exported SVG did not change since the previous build of a daemon are not processed again
+    keys = [None] * len(files)
+    slide_sizes = [None] * len(files)
+    if memory is not None:
+        for slide_no, slide_path in enumerate(files):
+            keys[slide_no] = memory_key(slide_no, slide_path, args)
+            if keys[slide_no] in memory:
+                slide_sizes[slide_no], outputs = memory[keys[slide_no]]
+                for name, data in outputs.items():
+                    (processed_directory / name).write_bytes(data)
 
     # We will go through all slides and
     # do a couple of modifications that makes the SVGs easier to work with
+    # Every slide is independent, so with --jobs they are spread over several processes.
+    todo = [slide_no for slide_no, size in enumerate(slide_sizes) if size is None]
+    todo_files = [files[slide_no] for slide_no in todo]
+    process = process_slide
+    if profiling.enabled():
+        process = partial(profiling.run_profiled, process_slide)
+    executor = None
+    if args.jobs > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=min(args.jobs, len(todo)))
+        results = executor.map(process, todo, todo_files, repeat(processed_directory), repeat(args))
+    else:
+        results = map(process, todo, todo_files, repeat(processed_directory), repeat(args))
+    if profiling.enabled():
+        results = profiling.collect(results)
 
-    page_size = (0, 0)
-
-    progress_bar = tqdm.tqdm(enumerate(files), desc="Processing slides", unit=" slides")
-    for slide_no, slide_path in progress_bar:
-        progress_bar.set_postfix_str(slide_path)
-        slide_name = slide_path.with_suffix("").name
-        doc = parse(str(slide_path))
-
-        process_node(doc, slide_no, root=doc)
-
-        # Extract the stages of the slide build
-        tree = ElementTree.fromstring(doc.toxml())
-        all_stages = [0]
-        for staged_element in tree.findall(".//*[@stage]"):
-            for stage in staged_element.attrib["stage"].split("-"):
-                all_stages.append(int(stage))
-        all_stages = sorted(list(set(all_stages)))
+    import tqdm
 
-        page_size = (
-            max(page_size[0], int(tree.attrib.get("width").replace("px", ""))),
-            max(page_size[1], int(tree.attrib.get("height").replace("px", "")))
-        )
+    try:
+        progress_bar = tqdm.tqdm(zip(todo, results), total=len(todo), desc="Processing slides", unit=" slides")
+        for slide_no, (size, outputs) in progress_bar:
+            check_cancelled(cancel)
+            progress_bar.set_postfix_str(files[slide_no])
+            slide_sizes[slide_no] = size
+            if memory is not None:
+                memory[keys[slide_no]] = (size, {name: (processed_directory / name).read_bytes() for name in outputs})
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
-        if not args.no_page_number:
-            if slide_no != 0:
-                add_page_number(tree, slide_no + 1)
+    if memory is not None:
+        for key in set(memory) - set(keys):
+            del memory[key]
+    page_size = (max((width for width, _ in slide_sizes), default=0), max((height for _, height in slide_sizes), default=0))
 
-        if args.no_build_stage:
-            ElementTree.ElementTree(tree).write(processed_directory / f"{slide_name}.svg")
-        else:
-            # Create new SVG file for each stage.
-            for stage in all_stages:
-                stage_doc = copy.deepcopy(tree)
-                filter_stage(stage_doc, stage)
-                ElementTree.ElementTree(stage_doc).write(processed_directory / f"{slide_name}_{stage:04}.svg")
+    check_cancelled(cancel)
 
     # Merge all SVG file stages into one PDF
     pdf_file = sketch_file.with_suffix(".pdf")
@@ -127,104 +180,338 @@ def build_slides(args):
     # Filters out [hidden] slides
     all_files = [file for file in all_files if not re.match(r".*\[.*hidden.*\]", file)]
 
-    if args.use_svg_convert:
-        subprocess.run(["rsvg-convert", "-f", "pdf", "-o", str(pdf_file)] + all_files)
+    if args.no_cache:
+        render_pdf(args, all_files, str(pdf_file), page_size, slides_directory)
     else:
-        convert_svgs_to_pdf(all_files, str(pdf_file), page_size=page_size, clean_up=not args.no_cleanup)
+        # Only render the stages that are not in the page cache yet
+        renderer = "rsvg-convert" if args.use_svg_convert else f"chrome:{find_chrome(args.chrome)}"
+        page_cache = PageCache(str(get_deck_cache_dir(args) / "pages"), renderer)
+        keys = [page_cache.key(file, page_size) for file in all_files]
+        missing = [(file, key) for file, key in zip(all_files, keys) if not page_cache.has(key)]
+        print(f"Rendering {len(missing)} of {len(all_files)} pages")
+        if missing:
+            rendered_file = str(slides_directory / "rendered.pdf")
+            render_pdf(args, [file for file, _ in missing], rendered_file, page_size, slides_directory)
+            with profiling.span("store pages", pages=len(missing)):
+                page_cache.store_pages(rendered_file, [key for _, key in missing])
+        with profiling.span("merge pdf", pages=len(keys)):
+            merge_pdfs([page_cache.path(key) for key in keys], str(pdf_file))
+        page_cache.prune(keys)
 
     if not args.no_cleanup:
         print("Clean up")
         shutil.rmtree(slides_directory)
 
 
-ID_GRAMMAR = makeGrammar(
+def export_artboards(args, sketch_file: pathlib.Path, slides_directory: pathlib.Path):
     """
-id_char = anything:x ?(x not in '[]') -> x
-id = id_char+:string -> "".join(string)
-value_string = id
-attribute_key = (<letterOrDigit> | '-')+:string -> "".join(string)
-attribute_value = '=' value_string:value -> value
-attribute = '[' attribute_key:key attribute_value?:value ']' -> (key, value)
-syntax = id?:id attribute*:attributes -> {'id': id, 'attributes': attributes}
-""",
-    {},
-)
+    Export the artboards of `sketch_file` as SVG files into `slides_directory`.
+    Artboards that did not change since an earlier build are copied from the cache,
+    only the others are exported (unless --no_cache is set).
+    """
+
+    def export_all():
+        with profiling.span("artboard export"):
+            subprocess.run([SKETCHTOOL_BIN, "export", "artboards", "--formats=svg", sketch_file, f"--output={slides_directory}"])
+
+    artboards = None if args.no_cache else index_artboards(str(sketch_file))
+    if artboards is None:
+        export_all()
+        return
+
+    artboard_cache = KeyedFileCache(str(get_deck_cache_dir(args) / "artboards"), ".svg")
+    missing = [(object_id, name, key) for object_id, name, key in artboards if not artboard_cache.has(key)]
+    print(f"Exporting {len(missing)} of {len(artboards)} artboards")
+    if missing:
+        export_directory = slides_directory / "export"
+        shutil.rmtree(export_directory, ignore_errors=True)
+        items = ",".join(object_id for object_id, _, _ in missing)
+        with profiling.span("artboard export", artboards=len(missing)):
+            subprocess.run(
+                [SKETCHTOOL_BIN, "export", "artboards", "--formats=svg", f"--items={items}", sketch_file, f"--output={export_directory}"]
+            )
+        for _, name, key in missing:
+            exported = export_directory / f"{name}.svg"
+            if not exported.is_file():
+                # Should not happen, but a complete export is always correct
+                print(f"{exported} was not exported, exporting all artboards")
+                shutil.rmtree(export_directory, ignore_errors=True)
+                export_all()
+                return
+            artboard_cache.store(str(exported), key)
+        shutil.rmtree(export_directory)
+
+    with profiling.span("copy cached artboards", artboards=len(artboards)):
+        for _, name, key in artboards:
+            target = slides_directory / f"{name}.svg"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(artboard_cache.path(key), target)
+    artboard_cache.prune([key for _, _, key in artboards])
+
+
+def get_cache_dir(args) -> pathlib.Path:
+    return pathlib.Path(args.cache_dir) if args.cache_dir else pathlib.Path(args.sketch_file).parent / ".sketch2pdf-cache"
+
+
+def get_deck_cache_dir(args) -> pathlib.Path:
+    """
+    The part of the cache that belongs to args.sketch_file. Every deck prunes its own cache
+    to the artboards and pages it uses, so decks that share a cache directory must not share these.
+    """
+    return get_cache_dir(args) / pathlib.Path(args.sketch_file).stem
+
+
+def render_pdf(args, svg_files: List[str], pdf_file: str, page_size: Tuple[int, int], work_dir: pathlib.Path):
+    if args.use_svg_convert:
+        with profiling.span("pdf render", pages=len(svg_files)):
+            subprocess.run(["rsvg-convert", "-f", "pdf", "-o", pdf_file] + svg_files)
+    else:
+        convert_svgs_to_pdf(
+            svg_files,
+            pdf_file,
+            page_size=page_size,
+            clean_up=not args.no_cleanup,
+            jobs=args.render_jobs,
+            batch_size=args.batch_size,
+            chrome_bin=args.chrome,
+            work_dir=str(work_dir),
+        )
 
 
-def process_node(node, slide, root, id_stack=[]):
+def memory_key(slide_no: int, slide_path: pathlib.Path, args) -> str:
+    """Identifies the processed files of an exported slide, for the daemon's in-memory cache."""
+    hasher = hashlib.sha256(repr((slide_no, args.no_page_number, args.no_build_stage)).encode("utf-8"))
+    hasher.update(slide_path.read_bytes())
+    return hasher.hexdigest()
+
+
+def process_slide(slide_no: int, slide_path: pathlib.Path, processed_directory: pathlib.Path, args) -> Tuple[Tuple[int, int], List[str]]:
+    """Write the processed SVG file(s) for one slide and return the slide's size and the names of the files."""
+    ElementTree.register_namespace("", "http://www.w3.org/2000/svg")
+
+    slide_name = slide_path.with_suffix("").name
+    with profiling.slide(slide_path):
+        with profiling.measure("parsing"):
+            tree = ElementTree.parse(slide_path).getroot()
+
+        with profiling.measure("id parsing"):
+            process_node(tree)
+
+        size = (
+            int(tree.attrib.get("width").replace("px", "")),
+            int(tree.attrib.get("height").replace("px", "")),
+        )
+
+        if not args.no_page_number:
+            if slide_no != 0:
+                add_page_number(tree, slide_no + 1)
+
+        if args.no_build_stage:
+            outputs = [f"{slide_name}.svg"]
+            with profiling.measure("serialization"):
+                ElementTree.ElementTree(tree).write(processed_directory / outputs[0])
+        else:
+            # Create new SVG file for each stage.
+            with profiling.measure("stage filtering"):
+                stages = StageIndex(tree)
+            outputs = [f"{slide_name}_{stage:04}.svg" for stage in stages.all_stages]
+            for stage, output in zip(stages.all_stages, outputs):
+                with profiling.measure("stage filtering"), stages.showing(stage):
+                    with profiling.measure("serialization"):
+                        ElementTree.ElementTree(tree).write(processed_directory / output)
+
+    return size, outputs
+
+
+def process_node(root: ElementTree.Element):
     # Parse the ID syntax     anythingblabla[attrkey=attrval][attrkey=attrval]
-    if not node.nodeType in [
-        xml.dom.Node.TEXT_NODE,
-        xml.dom.Node.COMMENT_NODE,
-        xml.dom.Node.DOCUMENT_NODE,
-    ]:
-        id_attr = node.getAttribute("id")
+    for node in root.iter():
+        id_attr = node.get("id")
         if id_attr is not None and id_attr != "":
-            parsed = ID_GRAMMAR(id_attr).syntax()
+            parsed = parse_id(id_attr)
 
             if parsed["id"] is not None:
-                node.setAttribute("id", parsed["id"])
+                node.set("id", parsed["id"])
             else:
-                node.setAttribute("id", "")
+                node.set("id", "")
 
             for (key, value) in parsed["attributes"]:
                 if value is None:
                     value = ""
-                node.setAttribute(key, value)
-
-    for child in node.childNodes:
-        process_node(child, slide, root, id_stack=id_stack)
-
-
-def filter_stage(node, current_stage: int):
-    """Keep nodes should be displayed during `current_stage`."""
-    node_to_remove = []
-    for child in node:
-        child_stage = child.attrib.get("stage")
-        keep_child = True
-        if child_stage is not None:
-            if "-" in child_stage:
-                from_, to_ = map(int, child_stage.split("-"))
-                if current_stage < from_ or current_stage > to_:
-                    keep_child = False
-            else:
-                if current_stage < int(child_stage):
-                    keep_child = False
+                node.set(key, value)
 
-        if not keep_child:
-            node_to_remove.append(child)
+
+class StageIndex:
+    """
+    Which elements of a slide are visible during which stage of the slide build,
+    computed in a single pass over the tree.
+
+    Instead of copying the tree for every stage, `showing(stage)` temporarily takes
+    the hidden elements out of their parents, and puts them back afterwards.
+    """
+
+    def __init__(self, root: ElementTree.Element):
+        stages = {0}
+        # For every element with staged children: (element, all children, visible interval of each child)
+        self._parents = []
+        for parent in root.iter():
+            children = list(parent)
+            intervals = [self._interval(child) for child in children]
+            if any(interval is not None for interval in intervals):
+                self._parents.append((parent, children, intervals))
+                for interval in intervals:
+                    if interval is not None:
+                        stages.update(interval.stages)
+        self.all_stages = sorted(stages)
+
+    @staticmethod
+    def _interval(element):
+        child_stage = element.attrib.get("stage")
+        if child_stage is None:
+            return None
+        return StageInterval(child_stage)
+
+    @contextlib.contextmanager
+    def showing(self, current_stage: int):
+        """Keep nodes should be displayed during `current_stage`."""
+        changed = []
+        for parent, children, intervals in self._parents:
+            visible = [
+                child
+                for child, interval in zip(children, intervals)
+                if interval is None or interval.contains(current_stage)
+            ]
+            if len(visible) != len(children):
+                parent[:] = visible
+                changed.append((parent, children))
+        try:
+            yield
+        finally:
+            for parent, children in changed:
+                parent[:] = children
+
+
+class StageInterval:
+    """The stages during which an element with a `stage=3` or `stage=3-5` attribute is visible."""
+
+    def __init__(self, stage_attribute: str):
+        self.stages = [int(stage) for stage in stage_attribute.split("-")]
+        if "-" in stage_attribute:
+            self.from_, self.to_ = self.stages
         else:
-            # Recurse on children
-            filter_stage(child, current_stage)
+            self.from_, self.to_ = self.stages[0], None
+
+    def contains(self, stage: int) -> bool:
+        if stage < self.from_:
+            return False
+        return self.to_ is None or stage <= self.to_
 
-    # Remove the nodes that are not at the current stage (cannot be done inside the for loop).
-    for e in node_to_remove:
-        node.remove(e)
 
+# An id attribute, or a reference to an id
+ID_REFERENCE = re.compile(
+    r"""(?P<attribute>(?<![\w:-])id=")(?P<id>[^"]*)(?=")"""
+    r"""|(?P<href>(?<![\w-])href="#)(?P<href_id>[^"]*)(?=")"""
+    r"""|(?P<url>url\(\s*['"]?#)(?P<url_id>[^)'"]*)"""
+)
+# A start tag, or markup whose content looks like tags but is not (comments, CDATA sections, processing instructions)
+START_TAG = re.compile(
+    r"""<!--.*?-->|<!\[CDATA\[.*?\]\]>|<[?!].*?>"""
+    r"""|(?P<tag><[A-Za-z_][^<>"']*(?:(?:"[^"]*"|'[^']*')[^<>"']*)*>)""",
+    re.DOTALL,
+)
 
 
-def process_svg(svg_content):
+def process_svg(svg_content, namespace=""):
     # Fix image base64
     svg_content = svg_content.replace('ns1:', '')
 
-    # Replace ids with unique random id to avoid collision between slides.
+    # Rename ids to avoid collision between slides.
     # Only applied to a selection of tags otherwise it breaks some images and Latex.
+    # The new ids are derived from `namespace` (the file name), so they are the same in every build.
+    from xml.sax.saxutils import escape
+
     tree = ElementTree.fromstring(svg_content)
-    all_ids = []
+    new_ids = {}
+    prefix = "a" + hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:8]
     for tag in ["mask", "rect", "polygon"]:
         for element_with_id in tree.findall(f".//{{http://www.w3.org/2000/svg}}{tag}[@id]"):
-            all_ids.append(element_with_id.attrib["id"])
-    # Replaces longest first to avoid replacing prefixes.
-    for id_ in sorted(all_ids, key=len, reverse=True):
-        svg_content = svg_content.replace(id_, "a" + str(uuid.uuid4())[:6])
-    return svg_content
+            # The table is keyed by the ids as they are written in the markup
+            id_ = escape(element_with_id.attrib["id"], {'"': "&quot;"})
+            if id_ not in new_ids:
+                new_ids[id_] = f"{prefix}-{len(new_ids)}"
+    if not new_ids:
+        return svg_content
+
+    # Rewrite the ids and their references (id="..", href="#..", url(#..)) in a single pass.
+    # Only in start tags: text can show the same markup, e.g. on slides with code.
+    def rename(match):
+        group = match.lastgroup
+        id_ = match.group(group)
+        prefix_group = {"id": "attribute", "href_id": "href", "url_id": "url"}[group]
+        return match.group(prefix_group) + new_ids.get(id_, id_)
+
+    def rename_in_tag(match):
+        if match.group("tag") is None:
+            return match.group()
+        return ID_REFERENCE.sub(rename, match.group())
+
+    return START_TAG.sub(rename_in_tag, svg_content)
+
+
+def convert_svgs_to_pdf(
+    svg_files: List[str],
+    output_file: str,
+    page_size: Tuple[int, int],
+    clean_up: bool = True,
+    jobs: int = 1,
+    batch_size: int = 0,
+    chrome_bin: Optional[str] = None,
+    work_dir: str = ".",
+):
+    """
+    Print the SVG files to PDF with headless Chrome, one page per file.
+    The files are split into batches (of `batch_size` files, or `jobs` equal batches by default)
+    that are rendered by `jobs` Chrome processes at once, and the partial PDFs are merged in order.
+    """
+    chrome_bin = find_chrome(chrome_bin)
+    if batch_size <= 0:
+        batch_size = max(1, -(-len(svg_files) // jobs))
+    batches = [svg_files[start : start + batch_size] for start in range(0, len(svg_files), batch_size)] or [[]]
+
+    if len(batches) == 1:
+        html_files = [os.path.join(work_dir, "tmp.html")]
+        pdf_files = [output_file]
+    else:
+        html_files = [os.path.join(work_dir, f"tmp-{i:04}.html") for i in range(len(batches))]
+        pdf_files = [os.path.join(work_dir, f"tmp-{i:04}.pdf") for i in range(len(batches))]
+
+    def render(batch_no):
+        with profiling.span("pdf render", batch=batch_no, pages=len(batches[batch_no])):
+            with open(html_files[batch_no], "w") as fp:
+                fp.write(slides_html(batches[batch_no], page_size))
+            render_html_to_pdf(html_files[batch_no], pdf_files[batch_no], chrome_bin)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            # list() re-raises the first error of any of the batches
+            list(executor.map(render, range(len(batches))))
+        if len(batches) > 1:
+            with profiling.span("merge pdf batches", batches=len(batches)):
+                merge_pdfs(pdf_files, output_file)
+    finally:
+        if clean_up:
+            for file in html_files + (pdf_files if len(batches) > 1 else []):
+                if os.path.exists(file):
+                    os.unlink(file)
 
 
-def convert_svgs_to_pdf(svg_files: List[str], output_file: str, page_size: Tuple[int, int], clean_up: bool = True):
+def slides_html(svg_files: List[str], page_size: Tuple[int, int]) -> str:
     """Based on https://gist.github.com/guillermo/3258662554c6afa2128492ca9a1a116c"""
     # content = "\n".join([f"<div class='slide'><img src='{file}' /></div>" for file in svg_files])
-    content = "\n".join([f"<div class='slide'>{process_svg(pathlib.Path(file).read_text())}</div>" for file in svg_files])
-    html=f"""
+    content = "\n".join([f"<div class='slide'>{process_svg(pathlib.Path(file).read_text(), namespace=pathlib.Path(file).name)}</div>" for file in svg_files])
+    return f"""
     <html>
     <head>
         <style>
@@ -250,15 +537,6 @@ def convert_svgs_to_pdf(svg_files: List[str], output_file: str, page_size: Tuple
     </html>
     """
 
-    tmpfile = "tmp.html"
-    try:
-        with open(tmpfile, "w") as fp:
-            fp.write(html)
-        subprocess.check_call(["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome", "--headless", "--disable-gpu", f"--print-to-pdf={output_file}", tmpfile])
-    finally:
-        if clean_up:
-            os.unlink(tmpfile)
-
 
 def add_page_number(slide, index: int):
     """Add slide number to the bottom right of the slide."""
@@ -270,26 +548,32 @@ def add_page_number(slide, index: int):
     slide.find(".//{http://www.w3.org/2000/svg}g").append(page_number_elemt)
 
 
-def check_dependencies():
+def check_dependencies(cache_dir: Optional[pathlib.Path] = None):
+    """
+    Exit if sketchtool does not run. Starting sketchtool takes a while, so with a `cache_dir`
+    a successful check is remembered until the sketchtool binary changes.
+    """
+    cache_file = None
+    binary = shutil.which(SKETCHTOOL_BIN)
+    if cache_dir is not None and binary is not None:
+        stat = os.stat(binary)
+        probe = [os.path.realpath(binary), stat.st_mtime_ns, stat.st_size]
+        cache_file = cache_dir / "dependencies.json"
+        try:
+            if json.loads(cache_file.read_text()).get("sketchtool") == probe:
+                return
+        except (OSError, ValueError):
+            pass
+
     try:
         subprocess.run([SKETCHTOOL_BIN, "--help"], check=True, capture_output=True)
     except (subprocess.CalledProcessError, FileNotFoundError):
         print("Please install sketchtool.")
         exit(1)
 
-
-class WatchHandler(FileSystemEventHandler):
-    def __init__(self, function, filename):
-        self.function = function
-        self.filename = filename
-        super().__init__()
-
-    def dispatch(self, event):
-        if isinstance(event, FileModifiedEvent) and event.src_path.endswith(self.filename):
-            print(f"\n\nDetected change in {event.src_path}. Re-building slides.\n")
-            self.function()
-            print()
-        return super().dispatch(event)
+    if cache_file is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomic(str(cache_file), json.dumps({"sketchtool": probe}).encode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""
+Persistent on-disk cache for processed slides.
+
+Every entry is keyed by the content hash of a source SVG, combined with a
+fingerprint of everything else that influences the processed markup
+(the ID grammar, the version of the processing code, output options).
+A watch-mode rebuild then only has to run `process_node` on slides that changed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+CACHE_FORMAT_VERSION = 1
+
+# Keys computed earlier in this process: (fingerprint, path) -> (mtime, size, key).
+# In watch mode this lets a rebuild skip reading the slides that did not change.
+_known_keys = {}
+
+
+def fingerprint(*parts):
+    """Combine anything that influences the processed output into a single hash."""
+    hasher = hashlib.sha256()
+    hasher.update(f"slide-cache-v{CACHE_FORMAT_VERSION}".encode("utf-8"))
+    for part in parts:
+        if not isinstance(part, (str, bytes)):
+            part = json.dumps(part, sort_keys=True)
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        hasher.update(hashlib.sha256(part).digest())
+    return hasher.hexdigest()
+
+
+class SlideCache:
+    """
+    Maps source SVG contents to their processed markup.
+
+    Entries are small JSON files `<key>.json` in `directory` that hold the processed SVG,
+    its metadata and the media files it refers to. An entry is only reused if those media files still exist.
+
+    A long-running process (see build_daemon.py) can also pass a dict as `memory`, which keeps
+    the entries between builds so they are not read from disk again. With `directory=None`
+    entries are only kept in memory.
+    """
+
+    def __init__(self, directory, fingerprint, memory=None):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+        self._used_keys = set()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, slide_path, changed=True):
+        """
+        Cache key of a slide. If the caller knows the slide did not change (`changed=False`),
+        the key from an earlier build is reused as long as the file's size and mtime are the same.
+        """
+        stat = os.stat(slide_path)
+        memo_key = (self.fingerprint, os.path.abspath(slide_path))
+        known = _known_keys.get(memo_key)
+        if not changed and known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+
+        hasher = hashlib.sha256(self.fingerprint.encode("utf-8"))
+        with open(slide_path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                hasher.update(chunk)
+        key = hasher.hexdigest()
+        _known_keys[memo_key] = (stat.st_mtime_ns, stat.st_size, key)
+        return key
+
+    def get(self, key, media_out_dir):
+        """Return the cached (content, metadata) for `key`, or None if it is missing or stale."""
+        self._used_keys.add(key)
+        entry = self.memory.get(key) if self.memory is not None else None
+        if entry is None:
+            entry = self._read_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        for media_file in entry["media"]:
+            if not os.path.isfile(os.path.join(media_out_dir, media_file)):
+                self.misses += 1
+                return None
+        if self.memory is not None:
+            self.memory[key] = entry
+        self.hits += 1
+        return entry["content"], entry.get("metadata")
+
+    def put(self, key, content, media, metadata=None):
+        self._used_keys.add(key)
+        entry = {"content": content, "media": sorted(set(media)), "metadata": metadata}
+        if self.memory is not None:
+            self.memory[key] = entry
+        if self.directory is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(entry, fp)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def prune(self):
+        """Delete entries that were not used since this cache was opened."""
+        if self.memory is not None:
+            for key in set(self.memory) - self._used_keys:
+                del self.memory[key]
+        if self.directory is None:
+            return
+        for filename in os.listdir(self.directory):
+            key, extension = os.path.splitext(filename)
+            if extension == ".json" and key not in self._used_keys:
+                os.unlink(os.path.join(self.directory, filename))
+
+    def _read_entry(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._entry_path(key), "r") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
@@ -0,0 +1,86 @@
+"""
+Per-slide metadata for the records in slides.json, so that the player does not have to
+search every slide's SVG for it:
+
+- `stages`: the build stages a slide mentions in its `stage` attributes, sorted and starting with 0.
+  The player shows every stage from 0 up to the last one.
+- `moves`: ids of the [move] elements that are visible in the last stage of a slide and have
+  an element with the same id in the first stage of the next slide. Nested moving elements
+  have the `-`-joined ids `process_node` gives them.
+
+`scan_slide` runs on the processed markup of each slide (and is cached with it),
+`match_moves` combines the scans of consecutive slides.
+"""
+
+import math
+from xml.parsers import expat
+
+
+def scan_slide(content):
+    """
+    Stages, the ids visible in the first stage and the ids of [move] elements visible
+    in the last stage of a processed slide.
+    """
+    stages = {0}
+    # (id, is [move], (from, to) stage intervals of the element and its ancestors; to=None means "until the end")
+    elements = []
+    intervals = []
+
+    def start_element(tag, attributes):
+        interval = _stage_interval(attributes.get("stage"))
+        intervals.append(interval)
+        if interval is not None:
+            stages.update(stage for stage in interval if stage is not None)
+        if attributes.get("id"):
+            visible = tuple(interval for interval in intervals if interval is not None)
+            elements.append((attributes["id"], "move" in attributes, visible))
+
+    def end_element(tag):
+        intervals.pop()
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(content, True)
+
+    last_stage = max(stages)
+    return {
+        "stages": sorted(stages),
+        "first": sorted({id_ for id_, _, visible in elements if _is_visible(visible, 0, last_stage)}),
+        "moves": sorted({id_ for id_, move, visible in elements if move and _is_visible(visible, last_stage, last_stage)}),
+    }
+
+
+def match_moves(scan, next_scan):
+    """Ids of the moving elements of a slide that the next slide continues."""
+    if next_scan is None:
+        return []
+    next_ids = set(next_scan["first"])
+    return [id_ for id_ in scan["moves"] if id_ in next_ids]
+
+
+def _stage_interval(stage_attribute):
+    """
+    (from, to) for `stage=3` (to=None) or `stage=2-5`, read like the player does.
+    None for elements without stages, or with stages the player cannot read.
+    """
+    if stage_attribute is None:
+        return None
+    parts = stage_attribute.split("-")
+    try:
+        from_ = _number(parts[0] or "0")
+        to = _number(parts[1]) if len(parts) > 1 and parts[1] else None
+    except ValueError:
+        return None
+    return from_, to
+
+
+def _number(text):
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(text)
+    return int(value) if value.is_integer() else value
+
+
+def _is_visible(intervals, stage, last_stage):
+    return all(from_ <= stage <= (last_stage if to is None else to) for from_, to in intervals)
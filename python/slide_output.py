@@ -0,0 +1,154 @@
+"""
+Writers for the list of `{"id", "content", "stages", "moves"}` slide records that `build_slides` produces.
+
+Four layouts are supported:
+
+- `json`: one `slides.json` with `indent=1` (the original format)
+- `compact`: the same JSON list without whitespace
+- `sharded`: a small manifest, plus the slides in separate shard files so a viewer can fetch them on demand.
+- `shared`: one compact file in which subtrees that repeat across slides are stored once (see shared_subtrees.py).
+
+In the sharded layout, the manifest at the output path looks like
+
+    {
+     "format": "slidekit-shards",
+     "version": 1,
+     "shards": ["slides.shards/3f2a...json", ...],
+     "slides": [{"id": ..., "hash": ..., "shard": 0, "offset": 1, "length": 5123}, ...]
+    }
+
+Every shard is a JSON list of slide records. `offset` and `length` are the byte range of
+a slide's record inside its shard, so a single slide can be fetched with an HTTP range request.
+Shards are named after the hash of their content and are only written if they don't exist yet,
+so a rebuild only rewrites the shards that changed.
+
+The shared layout looks like
+
+    {
+     "format": "slidekit-shared",
+     "version": 1,
+     "shared": {"3f2a9c0d1e4b5a67": "<g id=\"Logo\">...</g>", ...},
+     "slides": [{"id": ..., "content": "...<slidekit-shared ref=\"3f2a9c0d1e4b5a67\"/>...", ...}, ...]
+    }
+
+Consumers expand the references before parsing the slides: `read_slides` here,
+`expandSharedSlides` in the player (which `Controller` and `SlideDeck` call themselves).
+"""
+
+import hashlib
+import json
+import os
+
+from media import write_atomic
+from shared_subtrees import expand_shared, share_subtrees
+
+LAYOUTS = ["json", "compact", "sharded", "shared"]
+SHARDED_FORMAT = "slidekit-shards"
+SHARDED_VERSION = 1
+SHARED_FORMAT = "slidekit-shared"
+SHARED_VERSION = 1
+
+
+def write_slides(slide_list, output, layout="json", shard_size=1):
+    """Write the slides in `layout` and return the paths of the files that make up the output, `output` first."""
+    if layout == "json":
+        with open(output, "w") as fp:
+            json.dump(slide_list, fp, indent=1)
+    elif layout == "compact":
+        with open(output, "w") as fp:
+            json.dump(slide_list, fp, separators=(",", ":"))
+    elif layout == "sharded":
+        return write_sharded(slide_list, output, shard_size)
+    elif layout == "shared":
+        write_shared(slide_list, output)
+    else:
+        raise ValueError(f"Unknown output layout {layout}")
+    return [output]
+
+
+def write_sharded(slide_list, output, shard_size=1):
+    if shard_size < 1:
+        raise ValueError(f"The shard size must be at least 1, not {shard_size}")
+    output_dir = os.path.dirname(os.path.abspath(output))
+    shard_dir_name = os.path.splitext(os.path.basename(output))[0] + ".shards"
+    shard_dir = os.path.join(output_dir, shard_dir_name)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    manifest = {"format": SHARDED_FORMAT, "version": SHARDED_VERSION, "shards": [], "slides": []}
+
+    for first in range(0, len(slide_list), shard_size):
+        records = [
+            json.dumps(record, separators=(",", ":")).encode("utf-8")
+            for record in slide_list[first : first + shard_size]
+        ]
+
+        shard = bytearray(b"[")
+        for i, record in enumerate(records):
+            if i > 0:
+                shard += b","
+            manifest["slides"].append(
+                {
+                    "id": slide_list[first + i]["id"],
+                    "hash": hashlib.sha256(record).hexdigest()[:16],
+                    "shard": len(manifest["shards"]),
+                    "offset": len(shard),
+                    "length": len(record),
+                }
+            )
+            shard += record
+        shard += b"]"
+
+        shard_name = hashlib.sha256(shard).hexdigest()[:16] + ".json"
+        shard_path = os.path.join(shard_dir, shard_name)
+        if not os.path.isfile(shard_path):
+            write_atomic(shard_path, bytes(shard))
+        manifest["shards"].append(f"{shard_dir_name}/{shard_name}")
+
+    # Shards of earlier builds are no longer referenced
+    current = {os.path.basename(shard) for shard in manifest["shards"]}
+    for filename in os.listdir(shard_dir):
+        if filename.endswith(".json") and filename not in current:
+            os.unlink(os.path.join(shard_dir, filename))
+
+    with open(output, "w") as fp:
+        json.dump(manifest, fp, indent=1)
+    return [output] + [os.path.join(output_dir, shard) for shard in manifest["shards"]]
+
+
+def write_shared(slide_list, output):
+    contents, shared = share_subtrees([record["content"] for record in slide_list])
+    deck = {
+        "format": SHARED_FORMAT,
+        "version": SHARED_VERSION,
+        "shared": shared,
+        "slides": [dict(record, content=content) for record, content in zip(slide_list, contents)],
+    }
+    with open(output, "w") as fp:
+        json.dump(deck, fp, separators=(",", ":"))
+
+
+def read_slides(path):
+    """Read the list of slide records back, from any of the layouts."""
+    with open(path, "rb") as fp:
+        data = json.load(fp)
+    if isinstance(data, list):
+        return data
+    if data.get("format") == SHARED_FORMAT:
+        expanded = {}
+        return [
+            dict(record, content=expand_shared(record["content"], data["shared"], expanded))
+            for record in data["slides"]
+        ]
+    if data.get("format") != SHARDED_FORMAT:
+        raise ValueError(f"{path} is not a slides file")
+
+    base = os.path.dirname(os.path.abspath(path))
+    shards = {}
+    slide_list = []
+    for entry in data["slides"]:
+        if entry["shard"] not in shards:
+            with open(os.path.join(base, data["shards"][entry["shard"]]), "rb") as fp:
+                shards[entry["shard"]] = fp.read()
+        record = shards[entry["shard"]][entry["offset"] : entry["offset"] + entry["length"]]
+        slide_list.append(json.loads(record))
+    return slide_list
@@ -0,0 +1,362 @@
+"""
+Streaming version of `preprocess_slides.process_node`.
+
+Instead of building a minidom tree of the whole slide and serializing it with `toxml()`,
+the SVG is read with expat and every transform is applied while the elements come in:
+ID-syntax expansion, group flattening, `<use>` inlining, tspan splitting,
+polyline to path conversion and image extraction.
+The markup is written out as soon as it is known, in the same form `toxml()` produces,
+so memory use is bounded by the nesting depth and the size of `<defs>`, not by the document.
+
+Each element is processed exactly once.
+Documents that cannot be handled in a single pass (a `<use>` whose definition has not
+been read yet, a DOCTYPE declaration) raise `Unstreamable`, and callers fall back to the DOM version.
+"""
+
+import xml.dom
+from xml.parsers import expat
+
+import profiling
+from geometry import optimize_attributes, polyline_to_path_data
+from id_syntax import parse_id
+from media import extract_data_uri
+
+# How the children of an input element are handled
+PROCESS = 0  # transform and write them
+FLATTEN = 1  # the element is a removed <g>: transform and write them, inheriting its attributes
+SPLIT = 2  # the element is a <text> that is split up into one <text> per <tspan>
+RAW = 3  # write them as they are
+SKIP = 4  # drop them
+
+
+class Unstreamable(Exception):
+    """The document needs to be processed as a whole tree."""
+
+
+def process_svg_stream(slide_path, slide, media_out_dir, precision=None):
+    """
+    Process one SVG file without building a DOM.
+    Returns the processed markup and the media files it refers to, like `process_slide`.
+    """
+    processor = StreamProcessor(slide, media_out_dir, precision)
+    with open(slide_path, "rb") as fp, profiling.measure("streaming"):
+        processor.parse_file(fp)
+    with profiling.measure("serialization"):
+        content = processor.content()
+    return content, processor.media
+
+
+class _Frame:
+    __slots__ = ("kind", "closes", "pushed_id", "inherit", "split_tag", "split_attrs", "split_count")
+
+    def __init__(self, kind, closes=0, pushed_id=False):
+        self.kind = kind
+        self.closes = closes  # number of output elements to close at the end of this element
+        self.pushed_id = pushed_id  # whether this element pushed onto the id stack
+
+
+class _OutElement:
+    __slots__ = ("tag", "pending", "is_defs")
+
+    def __init__(self, tag, is_defs):
+        self.tag = tag
+        self.pending = True  # the start tag is not closed yet, we don't know if there are children
+        self.is_defs = is_defs
+
+
+class StreamProcessor:
+    def __init__(self, slide, media_out_dir, precision=None):
+        self.slide = slide
+        self.media_out_dir = media_out_dir
+        self.precision = precision  # optimize geometry with this many decimals, see geometry.py
+        self.media = []
+
+        self._out = []
+        self._frames = [_Frame(PROCESS)]
+        self._elements = []
+        self._id_stack = []
+        self._in_cdata = False
+
+        # Direct children of all <defs>, indexed by id, for inlining <use>.
+        # Each entry is (tag, attributes, serialized children).
+        self._defs_index = {}
+        self._capture = None
+        self._capture_level = None
+        self._capture_element = None
+
+    def parse_file(self, fp):
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._character_data
+        parser.CommentHandler = self._comment
+        parser.ProcessingInstructionHandler = self._processing_instruction
+        parser.StartCdataSectionHandler = self._start_cdata
+        parser.EndCdataSectionHandler = self._end_cdata
+        parser.StartDoctypeDeclHandler = self._doctype
+        parser.ParseFile(fp)
+
+    def content(self):
+        return '<?xml version="1.0" ?>' + "".join(self._out)
+
+    # Input events
+
+    def _start_element(self, tag, attribute_list):
+        parent = self._frames[-1]
+        if parent.kind == SKIP:
+            self._frames.append(_Frame(SKIP))
+            return
+
+        # minidom lists namespace declarations before the other attributes
+        attrs = {}
+        for i in range(0, len(attribute_list), 2):
+            if attribute_list[i] == "xmlns" or attribute_list[i].startswith("xmlns:"):
+                attrs[attribute_list[i]] = attribute_list[i + 1]
+        for i in range(0, len(attribute_list), 2):
+            attrs.setdefault(attribute_list[i], attribute_list[i + 1])
+
+        if parent.kind == RAW:
+            self._open_element(tag, attrs)
+            self._frames.append(_Frame(RAW, closes=1))
+        elif parent.kind == SPLIT:
+            with profiling.measure("tspan splitting"):
+                self._split_tspan(parent, tag, attrs)
+        else:
+            self._process_element(tag, attrs, parent)
+
+    def _end_element(self, tag):
+        frame = self._frames.pop()
+        for _ in range(frame.closes):
+            self._close_element()
+        if frame.pushed_id:
+            self._id_stack.pop()
+
+    def _character_data(self, data):
+        if self._frames[-1].kind in (SPLIT, SKIP):
+            return
+        self._open_parent()
+        self._write(data if self._in_cdata else escape(data))
+
+    def _comment(self, data):
+        if self._frames[-1].kind in (SPLIT, SKIP):
+            return
+        self._open_parent()
+        self._write(f"<!--{data}-->")
+
+    def _processing_instruction(self, target, data):
+        if self._frames[-1].kind in (SPLIT, SKIP):
+            return
+        self._open_parent()
+        self._write(f"<?{target} {data}?>")
+
+    def _start_cdata(self):
+        self._in_cdata = True
+        if self._frames[-1].kind in (SPLIT, SKIP):
+            return
+        self._open_parent()
+        self._write("<![CDATA[")
+
+    def _end_cdata(self):
+        self._in_cdata = False
+        if self._frames[-1].kind in (SPLIT, SKIP):
+            return
+        self._write("]]>")
+
+    def _doctype(self, *args):
+        raise Unstreamable("Documents with a DOCTYPE declaration are not supported.")
+
+    # Transforms
+
+    def _process_element(self, tag, attrs, parent):
+        # Inherit the attributes of a removed <g>
+        if parent.kind == FLATTEN:
+            with profiling.measure("group flattening"):
+                for key, value in parent.inherit:
+                    inherit_group_attribute(attrs, key, value)
+
+        # Parse the ID syntax     anythingblabla[attrkey=attrval][attrkey=attrval]
+        id_attr = attrs.get("id", "")
+        if id_attr != "":
+            with profiling.measure("id parsing"):
+                parsed = parse_id(id_attr)
+                attrs["id"] = parsed["id"] if parsed["id"] is not None else ""
+                for (key, value) in parsed["attributes"]:
+                    attrs[key] = value if value is not None else ""
+
+        pushed_id = False
+        if attrs.get("move") == "true":
+            self._id_stack.append(attrs.get("id", ""))
+            attrs["id"] = "-".join(self._id_stack)
+            pushed_id = True
+
+        # Remove <g> tags that are not meaningful for transitions, and move their children up
+        if tag == "g" and "move" not in attrs:
+            frame = _Frame(FLATTEN, pushed_id=pushed_id)
+            frame.inherit = list(attrs.items())
+            self._frames.append(frame)
+            return
+
+        # Inline 'use' statements
+        if tag == "use":
+            with profiling.measure("use inlining"):
+                self._inline_use(attrs)
+            self._frames.append(_Frame(SKIP, pushed_id=pushed_id))
+            return
+
+        # Break up <text> with multiple <tspan>'s, the <text> itself is dropped
+        if tag == "text" and "move" in attrs:
+            frame = _Frame(SPLIT, pushed_id=pushed_id)
+            frame.split_tag = tag
+            frame.split_attrs = attrs
+            frame.split_count = 0
+            self._frames.append(frame)
+            return
+
+        # Replace polylines by "path" because they morph better
+        if tag == "polyline":
+            with profiling.measure("polyline conversion"):
+                points = attrs.get("points", "")
+                tag = "path"
+                if "points" not in attrs:
+                    raise xml.dom.NotFoundErr()
+                del attrs["points"]
+                attrs["d"] = polyline_to_path_data(points)
+
+        # Delete inline images, because they make the file too big
+        if tag == "image" and attrs.get("xlink:href", "").startswith("data:"):
+            with profiling.measure("image extraction"):
+                href = extract_data_uri(attrs.pop("xlink:href"), self.media_out_dir)
+                attrs["href"] = href
+                self.media.append(href)
+
+        self._open_element(tag, attrs)
+        self._frames.append(_Frame(PROCESS, closes=1, pushed_id=pushed_id))
+
+    def _inline_use(self, attrs):
+        ref_id = attrs.get("xlink:href", "")[1:]
+        definition = self._defs_index.get(ref_id)
+        if definition is None:
+            # It may still be defined further down in the document.
+            raise Unstreamable(f"<use> of #{ref_id} before its definition")
+
+        tag, def_attrs, children = definition
+        if "id" not in def_attrs:
+            raise xml.dom.NotFoundErr()
+        clone = dict(def_attrs)
+        del clone["id"]
+        for key, value in attrs.items():
+            if key != "xlink:href":
+                clone[key] = value
+        self._write_element(tag, clone, children)
+
+    def _split_tspan(self, frame, tag, attrs):
+        if tag != "tspan":
+            self._frames.append(_Frame(SKIP))
+            return
+        frame.split_count += 1
+        text_attrs = dict(frame.split_attrs)
+        if "x" in attrs and "y" in attrs:
+            x = float(attrs.pop("x"))
+            y = float(attrs.pop("y"))
+            text_attrs["transform"] = f"translate({x},{y})"
+            text_attrs["id"] = text_attrs.get("id", "") + "-" + str(frame.split_count)
+        self._open_element(frame.split_tag, text_attrs)
+        self._open_element(tag, attrs)
+        self._frames.append(_Frame(RAW, closes=2))
+
+    # Output
+
+    def _write(self, string):
+        self._out.append(string)
+        if self._capture is not None:
+            self._capture.append(string)
+
+    def _open_parent(self):
+        if self._elements and self._elements[-1].pending:
+            self._elements[-1].pending = False
+            self._write(">")
+
+    def _open_element(self, tag, attrs):
+        self._open_parent()
+        parent_is_defs = bool(self._elements) and self._elements[-1].is_defs
+
+        self._write(f"<{tag}{serialize_attributes(self._optimized(tag, attrs))}")
+        self._elements.append(_OutElement(tag, tag == "defs"))
+
+        if parent_is_defs:
+            if self._capture is not None:
+                raise Unstreamable("<defs> nested inside a definition")
+            self._capture = []
+            self._capture_level = len(self._elements)
+            self._capture_element = (tag, dict(attrs))
+
+    def _close_element(self):
+        if self._capture is not None and len(self._elements) == self._capture_level:
+            tag, attrs = self._capture_element
+            children = "".join(self._capture)[1:] if not self._elements[-1].pending else ""
+            self._capture = None
+            self._register_definition(tag, attrs, children)
+
+        element = self._elements.pop()
+        if element.pending:
+            self._write("/>")
+        else:
+            self._write(f"</{element.tag}>")
+
+    def _write_element(self, tag, attrs, children):
+        """Write a complete element whose children are already serialized."""
+        self._open_parent()
+        if self._elements and self._elements[-1].is_defs:
+            self._register_definition(tag, attrs, children)
+        attrs = self._optimized(tag, attrs)
+        if children:
+            self._write(f"<{tag}{serialize_attributes(attrs)}>{children}</{tag}>")
+        else:
+            self._write(f"<{tag}{serialize_attributes(attrs)}/>")
+
+    def _optimized(self, tag, attrs):
+        # Definitions are registered with their original attributes, because the attributes
+        # of a <use> are added to them before they are optimized.
+        if self.precision is None:
+            return attrs
+        with profiling.measure("geometry optimization"):
+            return optimize_attributes(tag, attrs, self.precision)
+
+    def _register_definition(self, tag, attrs, children):
+        self._defs_index.setdefault(attrs.get("id", ""), (tag, attrs, children))
+
+
+def inherit_group_attribute(attrs, attribute, value):
+    """
+    Attribute-dictionary version of `preprocess_slides.apply_attr_to_groups_child`:
+    the child of a removed <g> inherits some of the group's properties.
+    """
+    if attribute == "id":
+        return
+    elif attribute == "transform":
+        attrs["transform"] = value + " " + attrs.get("transform", "").strip()
+    elif attribute == "opacity":
+        new_value = float(value)
+        if "opacity" in attrs:
+            new_value *= float(attrs["opacity"])
+        attrs["opacity"] = str(new_value)
+    elif attribute in ["x", "y"]:
+        new_value = float(value)
+        if attribute in attrs:
+            new_value += float(attrs[attribute])
+        attrs[attribute] = str(new_value)
+    else:
+        if not attribute in attrs:
+            attrs[attribute] = value
+
+
+def serialize_attributes(attrs):
+    """The attributes of a start tag, like `toxml()` writes them. Also used by transform_folding.py."""
+    return "".join(f' {key}="{escape(value)}"' for key, value in attrs.items())
+
+
+def escape(data):
+    # Same escaping as minidom's toxml()
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
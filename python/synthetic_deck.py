@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""
+Generate decks of synthetic slides for benchmarking, in the shape Sketch exports them:
+nested groups with ID-syntax names, <defs> referenced by <use>, text with several <tspan>'s,
+polylines, embedded images and build stages.
+
+The same parameters and seed always produce the same files.
+"""
+
+import base64
+import os
+import random
+from argparse import ArgumentParser
+
+# Share of the leaf elements that are <text>
+TEXT_SHARE = 0.1
+POLYLINE_POINTS = 24
+DEFINITIONS = 5
+
+
+def generate_deck(
+    directory,
+    slides=20,
+    nodes=200,
+    depth=4,
+    use_density=0.1,
+    tspans=3,
+    polylines=0.1,
+    image_size=0,
+    stages=3,
+    seed=0,
+):
+    """
+    Write `slides` SVG files to `directory` and return their paths.
+
+    Every slide has about `nodes` elements, nested up to `depth` groups deep.
+    `use_density` and `polylines` are the shares of <use> and <polyline> leaves,
+    every <text> has `tspans` tspans, and if `image_size` > 0, every slide embeds an image of that many bytes.
+    Elements are spread over `stages` build stages.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for slide_no in range(slides):
+        generator = _SlideGenerator(
+            random.Random(f"{seed}-{slide_no}"), depth, use_density, tspans, polylines, image_size, stages
+        )
+        path = os.path.join(directory, f"{slide_no:04} Slide.svg")
+        with open(path, "w") as fp:
+            fp.write(generator.slide(nodes))
+        paths.append(path)
+    return paths
+
+
+class _SlideGenerator:
+    def __init__(self, rng, depth, use_density, tspans, polylines, image_size, stages):
+        self.rng = rng
+        self.depth = depth
+        self.use_density = use_density
+        self.tspans = tspans
+        self.polylines = polylines
+        self.image_size = image_size
+        self.stages = stages
+        self.count = 0
+
+    def slide(self, nodes):
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            '<svg width="1280px" height="720px" viewBox="0 0 1280 720" version="1.1" '
+            'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">\n',
+            "    <title>Slide</title>\n",
+            "    <defs>\n",
+        ]
+        for i in range(DEFINITIONS):
+            parts.append(f'        <path d="{self._path_data()}" id="path-{i}" fill="#{self._color()}"></path>\n')
+        parts.append("    </defs>\n")
+        parts.append('    <g id="Page-1" stroke="none" stroke-width="1" fill="none" fill-rule="evenodd">\n')
+        if self.image_size > 0:
+            data = base64.b64encode(self.rng.randbytes(self.image_size)).decode("ascii")
+            parts.append(
+                f'        <image id="Photo{self._stage()}" x="40" y="40" width="320" height="240" '
+                f'xlink:href="data:image/png;base64,{data}"></image>\n'
+            )
+        parts.extend(self._children(nodes, 1))
+        parts.append("    </g>\n</svg>\n")
+        return "".join(parts)
+
+    def _children(self, budget, level):
+        parts = []
+        while budget > 0:
+            if level < self.depth and budget > 1 and self.rng.random() < 0.3:
+                size = self.rng.randint(1, budget - 1)
+                parts.extend(self._group(size, level))
+                budget -= size + 1
+            else:
+                parts.append(self._leaf(level))
+                budget -= 1
+        return parts
+
+    def _group(self, size, level):
+        indent = "    " * (level + 1)
+        name = self._name("Group", move_share=0.2)
+        transform = f"translate({self.rng.randint(0, 200)}.000000, {self.rng.randint(0, 200)}.000000)"
+        return [f'{indent}<g id="{name}" transform="{transform}">\n'] + self._children(size, level + 1) + [f"{indent}</g>\n"]
+
+    def _leaf(self, level):
+        indent = "    " * (level + 1)
+        kind = self.rng.random()
+        if kind < self.use_density:
+            return f'{indent}<use id="{self._name("Use")}" fill="#{self._color()}" xlink:href="#path-{self.rng.randrange(DEFINITIONS)}"></use>\n'
+        kind -= self.use_density
+        if kind < self.polylines:
+            points = " ".join(
+                f"{self.rng.uniform(0, 1280):.2f} {self.rng.uniform(0, 720):.2f}" for _ in range(POLYLINE_POINTS)
+            )
+            return f'{indent}<polyline id="{self._name("Line")}" stroke="#{self._color()}" points="{points}"></polyline>\n'
+        kind -= self.polylines
+        if kind < TEXT_SHARE:
+            spans = "".join(
+                f'<tspan x="{self.rng.randint(0, 1200)}" y="{40 + 30 * i}">Line {i} of some text &amp; more</tspan>'
+                for i in range(self.tspans)
+            )
+            return f'{indent}<text id="{self._name("Text", move_share=0.5)}" font-family="Helvetica" font-size="24" fill="#{self._color()}">{spans}</text>\n'
+        x, y = self.rng.randint(0, 1200), self.rng.randint(0, 700)
+        return f'{indent}<rect id="{self._name("Rectangle")}" fill="#{self._color()}" x="{x}" y="{y}" width="{self.rng.randint(1, 80)}" height="{self.rng.randint(1, 80)}"></rect>\n'
+
+    def _name(self, prefix, move_share=0.0):
+        self.count += 1
+        name = f"{prefix}-{self.count}"
+        if self.rng.random() < move_share:
+            name += "[move]"
+        return name + self._stage()
+
+    def _stage(self):
+        if self.stages <= 1 or self.rng.random() < 0.5:
+            return ""
+        first = self.rng.randint(1, self.stages - 1)
+        if self.rng.random() < 0.3:
+            return f"[stage={first}-{self.rng.randint(first, self.stages - 1)}]"
+        return f"[stage={first}]"
+
+    def _color(self):
+        return f"{self.rng.randrange(1 << 24):06X}"
+
+    def _path_data(self):
+        points = [f"{self.rng.randint(0, 100)},{self.rng.randint(0, 100)}" for _ in range(6)]
+        return "M" + " L".join(points) + " Z"
+
+
+def add_deck_arguments(parser):
+    """The `generate_deck` parameters as command line options, shared with benchmark.py."""
+    parser.add_argument("--slides", type=int, default=20, help="Number of slides.")
+    parser.add_argument("--nodes", type=int, default=200, help="Elements per slide.")
+    parser.add_argument("--depth", type=int, default=4, help="Maximum nesting depth of groups.")
+    parser.add_argument("--use-density", type=float, default=0.1, help="Share of elements that are <use>.")
+    parser.add_argument("--tspans", type=int, default=3, help="Number of <tspan>'s per <text>.")
+    parser.add_argument("--polylines", type=float, default=0.1, help="Share of elements that are <polyline>.")
+    parser.add_argument("--image-size", type=int, default=0, help="Bytes of the image embedded in every slide (0: none).")
+    parser.add_argument("--stages", type=int, default=3, help="Number of build stages per slide.")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def deck_options(args):
+    return dict(
+        slides=args.slides,
+        nodes=args.nodes,
+        depth=args.depth,
+        use_density=args.use_density,
+        tspans=args.tspans,
+        polylines=args.polylines,
+        image_size=args.image_size,
+        stages=args.stages,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("directory", help="Directory to write the slides to.")
+    add_deck_arguments(parser)
+    args = parser.parse_args()
+    paths = generate_deck(args.directory, **deck_options(args))
+    print(f"Wrote {len(paths)} slides to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
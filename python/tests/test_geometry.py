@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from geometry import collapse_transform, optimize_attributes
+from preprocess_slides import build_slides
+
+SLIDE = """<?xml version="1.0" encoding="UTF-8"?>
+<svg width="100" height="100" xmlns="http://www.w3.org/2000/svg">{}</svg>
+"""
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_move_target_keeps_its_transform_parts(tmp_path, streaming):
+    slides = tmp_path / "slides"
+    slides.mkdir()
+    (slides / "1.svg").write_text(
+        SLIDE.format('<path id="X[move=true]" d="M0 0L10 0" transform="translate(10,0) translate(0,0) rotate(90)"/>')
+    )
+    (slides / "2.svg").write_text(
+        SLIDE.format('<path id="X" d="M0 0L10 0" transform="translate(20.123,0) translate(0,0) rotate(45)"/>')
+    )
+    output = tmp_path / "slides.json"
+
+    build_slides(str(slides), str(output), str(tmp_path / "dist"), streaming=streaming, precision=2)
+
+    source, target = json.loads(output.read_text())
+    assert source["moves"] == ["X"]
+    assert 'transform="translate(10,0) translate(0,0) rotate(90)"' in source["content"]
+    assert 'transform="translate(20.12,0) translate(0,0) rotate(45)"' in target["content"]
+
+
+def test_collapses_transforms_of_other_elements():
+    attrs = optimize_attributes("path", {"transform": "translate(20,0) rotate(45)"}, 2)
+    assert attrs == {"transform": "matrix(.70711,.70711,-.70711,.70711,20,0)"}
+    assert optimize_attributes("rect", {"transform": "translate(0,0) scale(1)"}, 2) == {}
+
+
+def test_kept_parts_are_only_rounded():
+    transform = "translate(0,0) translate(1.234,5) scale(2) scale(1.5,1) rotate(0) rotate(30.00001,1.234,0)"
+    assert collapse_transform(transform, 1, keep_parts=True) == (
+        "translate(0,0) translate(1.2,5) scale(2) scale(1.5,1) rotate(0) rotate(30,1.2,0)"
+    )
+
+
+def test_stroke_width_is_not_rounded_to_zero():
+    assert optimize_attributes("path", {"stroke-width": "0.5"}, 0) == {"stroke-width": "1"}
+    assert optimize_attributes("path", {"stroke-width": "0.004"}, 2) == {"stroke-width": ".01"}
+    assert optimize_attributes("path", {"stroke-width": "0"}, 2) == {"stroke-width": "0"}
+    assert optimize_attributes("path", {"stroke-width": "1.26"}, 1) == {"stroke-width": "1.3"}
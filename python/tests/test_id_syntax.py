@@ -0,0 +1,8 @@
+import pytest
+
+from id_syntax import DIFFERENTIAL_CORPUS, check_against_grammar
+
+
+def test_fast_parser_agrees_with_the_grammar():
+    pytest.importorskip("parsley")
+    assert check_against_grammar() == len(DIFFERENTIAL_CORPUS) + 2000
@@ -0,0 +1,17 @@
+import os
+import stat
+
+import pytest
+
+from media import write_atomic
+
+
+@pytest.mark.parametrize("umask", [0o022, 0o077])
+def test_written_files_get_the_permissions_of_new_files(tmp_path, umask):
+    previous = os.umask(umask)
+    try:
+        write_atomic(str(tmp_path / "image.png"), b"png")
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE(os.stat(tmp_path / "image.png").st_mode) == 0o666 & ~umask
+    assert os.listdir(tmp_path) == ["image.png"]
@@ -0,0 +1,37 @@
+import hashlib
+
+from sketch2pdf import process_svg
+
+PREFIX = "a" + hashlib.sha1(b"slide").hexdigest()[:8]
+
+
+def test_ids_and_their_references_are_renamed():
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'
+        '<mask id="m"><rect id="r" width="1" height="1"/></mask>'
+        '<use xlink:href="#r" mask="url(#m)" style="fill: url(\'#r\')"/>'
+        '<g id="r-not"/>'
+        "</svg>"
+    )
+    assert process_svg(svg, "slide") == (
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'
+        f'<mask id="{PREFIX}-0"><rect id="{PREFIX}-1" width="1" height="1"/></mask>'
+        f'<use xlink:href="#{PREFIX}-1" mask="url(#{PREFIX}-0)" style="fill: url(\'#{PREFIX}-1\')"/>'
+        '<g id="r-not"/>'
+        "</svg>"
+    )
+
+
+def test_text_that_looks_like_references_is_kept():
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg"><rect id="r"/>'
+        '<text>r m id="r" href="#r" url(#r) &lt;rect id="r"/&gt;</text>'
+        '<!-- <rect id="r"/> --><style><![CDATA[ <rect id="r"/> ]]></style>'
+        "</svg>"
+    )
+    assert process_svg(svg, "slide") == (
+        f'<svg xmlns="http://www.w3.org/2000/svg"><rect id="{PREFIX}-0"/>'
+        '<text>r m id="r" href="#r" url(#r) &lt;rect id="r"/&gt;</text>'
+        '<!-- <rect id="r"/> --><style><![CDATA[ <rect id="r"/> ]]></style>'
+        "</svg>"
+    )
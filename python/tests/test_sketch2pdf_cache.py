@@ -0,0 +1,92 @@
+import json
+import sys
+import zipfile
+
+import pytest
+
+import sketch2pdf
+
+# Stand-in for `sketchtool export artboards`. Exports the artboards of .sketch archives (or the ones in --items)
+# and logs their names to sketchtool.log, other files get two artboards named after the file.
+SKETCHTOOL_STAND_IN = """#!{python}
+import json, pathlib, sys, zipfile
+sketch_file = pathlib.Path(next(a for a in sys.argv[1:] if a.endswith(".sketch")))
+output = pathlib.Path(next(a for a in sys.argv[1:] if a.startswith("--output="))[len("--output="):])
+items = next((a[len("--items="):].split(",") for a in sys.argv[1:] if a.startswith("--items=")), None)
+output.mkdir(parents=True, exist_ok=True)
+try:
+    with zipfile.ZipFile(sketch_file) as archive:
+        layers = [json.loads(archive.read(name))["layers"] for name in archive.namelist() if name.startswith("pages/")]
+    names = [layer["name"] for page in layers for layer in page if items is None or layer["do_objectID"] in items]
+except zipfile.BadZipFile:
+    names = [f"{{number}} {{sketch_file.stem}}" for number in (1, 2)]
+for name in names:
+    (output / f"{{name}}.svg").write_text(
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100"><g><text>{{name}}</text></g></svg>'
+    )
+with open(pathlib.Path(sys.argv[0]).with_suffix(".log"), "a") as log:
+    log.writelines(name + "\\n" for name in names)
+"""
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """
+    Build a deck in tmp_path with stand-ins for sketchtool and the PDF renderer,
+    and return the number of exported artboards and rendered pages.
+    """
+    pypdf = pytest.importorskip("pypdf")
+    sketchtool = tmp_path / "sketchtool"
+    sketchtool.write_text(SKETCHTOOL_STAND_IN.format(python=sys.executable))
+    sketchtool.chmod(0o755)
+    monkeypatch.setattr(sketch2pdf, "SKETCHTOOL_BIN", str(sketchtool))
+    exported = tmp_path / "sketchtool.log"
+
+    rendered = []
+
+    def render_pdf(args, svg_files, pdf_file, page_size, work_dir):
+        rendered.extend(svg_files)
+        writer = pypdf.PdfWriter()
+        for _ in svg_files:
+            writer.add_blank_page(width=100, height=100)
+        with open(pdf_file, "wb") as fp:
+            writer.write(fp)
+
+    monkeypatch.setattr(sketch2pdf, "render_pdf", render_pdf)
+
+    def build(name, artboards=None):
+        sketch_file = tmp_path / f"{name}.sketch"
+        if artboards is None:
+            # Not a zip archive, so all artboards are exported
+            sketch_file.write_bytes(b"")
+        else:
+            write_sketch_file(sketch_file, artboards)
+        exported.write_text("")
+        del rendered[:]
+        sketch2pdf.build_slides(sketch2pdf.get_parser().parse_args([str(sketch_file), "--use_svg_convert"]))
+        return len(exported.read_text().splitlines()), len(rendered)
+
+    return build
+
+
+def write_sketch_file(path, artboards):
+    """A .sketch archive with one page of artboards with the given names."""
+    layers = [{"_class": "artboard", "do_objectID": f"{path.stem}-{name}", "name": name} for name in artboards]
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("document.json", json.dumps({"_class": "document"}))
+        archive.writestr("meta.json", json.dumps({"appVersion": "99", "version": 1}))
+        archive.writestr("pages/page.json", json.dumps({"_class": "page", "layers": layers}))
+
+
+def test_decks_in_one_folder_keep_their_cached_pages(build):
+    assert build("a") == (2, 2)
+    assert build("b") == (2, 2)
+    assert build("a") == (2, 0)
+    assert build("b") == (2, 0)
+
+
+def test_decks_in_one_folder_keep_their_cached_artboards(build):
+    assert build("a", ["1 title", "2 end"]) == (2, 2)
+    assert build("b", ["1 intro"]) == (1, 1)
+    assert build("a", ["1 title", "2 end"]) == (0, 0)
+    assert build("b", ["1 intro"]) == (0, 0)
@@ -0,0 +1,32 @@
+import re
+
+from preprocess_slides import build_options, build_slides, get_parser
+
+SLIDE = """<?xml version="1.0" encoding="UTF-8"?>
+<svg width="100" height="100" xmlns="http://www.w3.org/2000/svg"><text>{}</text></svg>
+"""
+
+
+def write_deck(directory, slides):
+    directory.mkdir()
+    for number in range(1, slides + 1):
+        (directory / f"{number}.svg").write_text(SLIDE.format(f"{directory.name} {number}"))
+    return str(directory)
+
+
+def test_outputs_in_one_folder_keep_their_cached_slides(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    deck = write_deck(tmp_path / "deck", 3)
+    edge = write_deck(tmp_path / "edge", 2)
+
+    def build(*argv):
+        args = get_parser().parse_args([*argv, "--jobs", "1"])
+        capsys.readouterr()
+        build_slides(args.slide_directory, args.output, args.media_out_dir, **build_options(args))
+        counts = re.search(r"Re-used (\d+) cached slides, processed (\d+)", capsys.readouterr().out)
+        return [int(count) for count in counts.groups()]
+
+    assert build(deck, "-o", "a.json") == [0, 3]
+    assert build(edge, "-o", "b.json", "--fold-transforms") == [0, 2]
+    assert build(deck, "-o", "a.json") == [3, 0]
+    assert build(edge, "-o", "b.json", "--fold-transforms") == [2, 0]
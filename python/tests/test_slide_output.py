@@ -0,0 +1,17 @@
+import pytest
+
+from preprocess_slides import get_parser
+from slide_output import write_sharded
+
+
+@pytest.mark.parametrize("shard_size", ["0", "-1"])
+def test_shard_size_must_be_positive(shard_size, capsys):
+    with pytest.raises(SystemExit):
+        get_parser().parse_args(["slides", "--format", "sharded", "--shard-size", shard_size])
+    assert "--shard-size: must be at least 1" in capsys.readouterr().err
+
+
+def test_write_sharded_rejects_empty_shards(tmp_path):
+    with pytest.raises(ValueError):
+        write_sharded([{"id": "1"}], str(tmp_path / "slides.json"), shard_size=0)
+    assert not (tmp_path / "slides.shards").exists()
@@ -0,0 +1,37 @@
+import pytest
+
+from preprocess_slides import build_slides
+
+SLIDE = """<?xml version="1.0" encoding="UTF-8"?>
+<svg width="100.5" height="100.25" viewBox="0 0 100.5 100.25" xmlns="http://www.w3.org/2000/svg">
+ <g id="Group" transform="translate(10.123456, 0.5)" stroke="#000" stroke-width="1.5">
+  <path d="M0.123456,0.987654 L10.555555,20.444444 C1,2 3,4 5.55555,6.66666 Z" transform="translate(0,0) scale(1.5)"/>
+  <polyline points="0.111 0.222 10.333 10.444 20.555 0.666"/>
+  <rect x="1.23456" y="2.34567" width="3.45678" height="4.56789" transform="rotate(30) translate(1,2)"/>
+  <circle cx="5.5555" cy="6.6666" r="0.4444"/>
+ </g>
+ <text x="1.23456" y="7.891">Precision 1.23456</text>
+</svg>
+"""
+
+
+@pytest.mark.parametrize("fold_transforms", [False, True])
+@pytest.mark.parametrize("precision", [0, 2])
+def test_streaming_writes_the_same_slides_as_the_dom(tmp_path, precision, fold_transforms):
+    slides = tmp_path / "slides"
+    slides.mkdir()
+    (slides / "1.svg").write_text(SLIDE)
+
+    outputs = []
+    for streaming in (False, True):
+        output = tmp_path / f"{streaming}.json"
+        build_slides(
+            str(slides),
+            str(output),
+            str(tmp_path / "dist"),
+            streaming=streaming,
+            precision=precision,
+            fold_transforms=fold_transforms,
+        )
+        outputs.append(output.read_text())
+    assert outputs[0] == outputs[1]
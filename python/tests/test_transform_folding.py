@@ -0,0 +1,66 @@
+import json
+import re
+
+from preprocess_slides import build_slides
+from transform_folding import fold_transforms
+
+SLIDE = """<?xml version="1.0" encoding="UTF-8"?>
+<svg width="100" height="100" xmlns="http://www.w3.org/2000/svg">{}</svg>
+"""
+
+
+def attributes(content, tag):
+    return [dict(re.findall(r'([\w:-]+)="([^"]*)"', match)) for match in re.findall(rf"<{tag}\b([^>]*)>", content)]
+
+
+def test_move_target_keeps_its_coordinates(tmp_path):
+    slides = tmp_path / "slides"
+    slides.mkdir()
+    (slides / "1.svg").write_text(
+        SLIDE.format('<path id="X[move=true]" d="M0 0L10 0" transform="translate(10,0) rotate(90)"/>')
+    )
+    (slides / "2.svg").write_text(SLIDE.format('<path id="X" d="M0 0L10 0" transform="translate(20,0) rotate(45)"/>'))
+    output = tmp_path / "slides.json"
+
+    build_slides(str(slides), str(output), str(tmp_path / "dist"), fold_transforms=True)
+
+    source, target = json.loads(output.read_text())
+    assert source["moves"] == ["X"]
+    [source_path] = attributes(source["content"], "path")
+    assert source_path["d"] == "M0 0L10 0"
+    assert source_path["transform"] == "translate(10,0) rotate(90)"
+    # The target of the move is left alone, so the player interpolates transform and d consistently
+    [target_path] = attributes(target["content"], "path")
+    assert target_path["d"] == "M0 0L10 0"
+    assert target_path["transform"] == "translate(20,0) rotate(45)"
+
+
+def test_folds_and_collapses_chains():
+    content = SLIDE.format(
+        '<path d="M0 0h10" transform="translate(1,2) translate(3,4)"/>'
+        '<path id="A" d="M0 0h10" transform="translate(1,2) translate(3,4)"/>'
+        '<rect width="1" height="1" transform="translate(1,2) scale(2)"/>'
+    )
+    paths = attributes(fold_transforms(content), "path")
+    assert paths[0] == {"d": "M4 6H14"}
+    assert paths[1] == {"id": "A", "d": "M0 0h10", "transform": "translate(1,2) translate(3,4)"}
+    [rect] = attributes(fold_transforms(content), "rect")
+    assert rect["transform"] == "matrix(2,0,0,2,1,2)"
+
+
+def test_stroke_is_scaled_with_uniform_scales_only():
+    content = SLIDE.format(
+        '<g stroke="#000" stroke-width="2">'
+        '<path d="M0 0L1 1" transform="scale(2)"/>'
+        '<path d="M0 0L1 1" transform="scale(2,3)"/>'
+        "</g>"
+    )
+    uniform, other = attributes(fold_transforms(content), "path")
+    assert uniform == {"d": "M0 0L2 2", "stroke-width": "4"}
+    assert other == {"d": "M0 0L1 1", "transform": "scale(2,3)"}
+
+
+def test_scaled_stroke_is_not_rounded_to_zero():
+    content = SLIDE.format('<path d="M0 0L10 0" stroke="#000" stroke-width="1" transform="scale(0.4)"/>')
+    [path] = attributes(fold_transforms(content, precision=0), "path")
+    assert path == {"d": "M0 0H4", "stroke": "#000", "stroke-width": "1"}
@@ -0,0 +1,284 @@
+"""
+Transform folding (`--fold-transforms`): fewer transforms for the browser to evaluate.
+
+Flattening groups leaves elements with chains of transforms like `translate(10,20) rotate(30) translate(-5,0)`,
+one part per removed group, and the browser evaluates the whole chain in every frame of a transition.
+`fold_transforms` runs on the processed markup of a slide, composes the transform chain of every element
+into one matrix and then
+
+- folds the transform into the coordinates of paths, polygons and polylines where that looks the same,
+  and removes the `transform` attribute,
+- collapses the chains of other elements into a single `matrix()` or `translate()`.
+
+Elements with [move] keep their transforms as they are, because the player interpolates them part by part.
+So do all elements with an id: the element a [move] moves to in the next stage is found by its id alone
+(see transitions/move.ts in slidekit), and other elements refer to elements by id (`href`, `appear-along`).
+Only elements with nothing but geometry and paint attributes are folded, outside of <defs>, <clipPath> and the like,
+so that transitions, preprocessors, gradients, clips, masks, filters and markers see the same coordinates as before.
+Arcs are only folded into translations, because their radii do not transform like points.
+Strokes are scaled with the element: with a uniform scale the stroke width and dashes are scaled to match,
+other scales are not folded into stroked elements.
+"""
+
+import math
+import re
+from xml.parsers import expat
+
+from geometry import (
+    IDENTITY,
+    NUMBER,
+    PLAIN_NUMBER,
+    format_matrix,
+    format_non_zero,
+    format_number,
+    join_numbers,
+    multiply,
+    optimize_path_data,
+    parse_path_data,
+    parse_transform,
+    transform_matrix,
+)
+from svgstream import serialize_attributes
+
+FOLDABLE_TAGS = {"path", "polygon", "polyline"}
+# Any other attribute may refer to the element's own coordinates (transitions, preprocessors, clips, markers, styles)
+FOLDABLE_ATTRIBUTES = {
+    "id",
+    "transform",
+    "d",
+    "points",
+    "stage",
+    "opacity",
+    "visibility",
+    "display",
+    "fill",
+    "fill-opacity",
+    "fill-rule",
+    "stroke",
+    "stroke-width",
+    "stroke-opacity",
+    "stroke-linecap",
+    "stroke-linejoin",
+    "stroke-miterlimit",
+    "stroke-dasharray",
+    "stroke-dashoffset",
+}
+# Elements inside anything else (<defs>, <clipPath>, <mask>, <pattern>, <marker>, ...) are not folded
+FOLDABLE_ANCESTORS = {"svg", "g", "a"}
+# Inherited properties that decide whether folding is safe
+INHERITED_PROPERTIES = ("fill", "stroke", "stroke-width", "stroke-dasharray", "stroke-dashoffset")
+# Set by `style` or `class`, which this does not evaluate
+UNKNOWN = object()
+
+# Decimals of folded coordinates without `--precision`
+DECIMALS = 6
+TOLERANCE = 1e-9
+DASH_ARRAY = re.compile(rf"\s*{NUMBER.pattern}(?:\s*,?\s*{NUMBER.pattern})*\s*$")
+
+
+def fold_transforms(content, precision=None):
+    """The markup of a processed slide with folded and collapsed transforms."""
+    data = content.encode("utf-8")
+
+    elements = []  # (start, tag, attributes, inherited properties, in a foldable place)
+    # (in a foldable place, inherited properties) of the open elements
+    stack = [(True, {})]
+
+    def start_element(tag, attribute_list):
+        attrs = dict(zip(attribute_list[::2], attribute_list[1::2]))
+        foldable_place, inherited = stack[-1]
+        properties = dict(inherited)
+        if "style" in attrs or "class" in attrs:
+            properties.update((name, UNKNOWN) for name in INHERITED_PROPERTIES)
+        properties.update((name, attrs[name]) for name in INHERITED_PROPERTIES if name in attrs)
+        stack.append((foldable_place and tag in FOLDABLE_ANCESTORS, properties))
+
+        # [move] elements, and elements with an id (which may be where a [move] of the previous stage
+        # moves to, found by id alone), keep their transforms: the player interpolates them part by part
+        if "transform" in attrs and "move" not in attrs and not attrs.get("id"):
+            elements.append((parser.CurrentByteIndex, tag, attrs, properties, foldable_place))
+
+    def end_element(tag):
+        stack.pop()
+
+    parser = expat.ParserCreate()
+    parser.ordered_attributes = True
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(data, True)
+
+    replacements = {}
+    for start, tag, attrs, properties, foldable_place in elements:
+        parts = parse_transform(attrs["transform"])
+        chain = [transform_matrix(name, values) for name, values in parts or []]
+        if not parts or None in chain:
+            continue
+        matrix = IDENTITY
+        for part in chain:
+            matrix = multiply(matrix, part)
+
+        folded = None
+        if tag in FOLDABLE_TAGS and foldable_place:
+            folded = _fold(tag, attrs, properties, matrix, precision)
+        if folded is not None:
+            replacements[start] = _start_tag(tag, folded)
+        elif len(chain) > 1:
+            attrs = dict(attrs, transform=format_matrix(matrix, DECIMALS if precision is None else precision))
+            if attrs["transform"] == "" and "scale" not in attrs:
+                # preprocessors/scale.ts in slidekit appends to the existing transform
+                del attrs["transform"]
+            replacements[start] = _start_tag(tag, attrs)
+
+    if not replacements:
+        return content
+    parts = []
+    position = 0
+    for start in sorted(replacements):
+        end = data.index(b">", start)
+        if data[end - 1 : end] == b"/":
+            end -= 1
+        parts.append(data[position:start])
+        parts.append(replacements[start].encode("utf-8"))
+        position = end
+    parts.append(data[position:])
+    return b"".join(parts).decode("utf-8")
+
+
+def _fold(tag, attrs, properties, matrix, precision):
+    """
+    The attributes of an element with `matrix` folded into its coordinates,
+    or None if that would change how it looks.
+    """
+    if not set(attrs) <= FOLDABLE_ATTRIBUTES:
+        return None
+    for name in ("fill", "stroke"):
+        value = properties.get(name)
+        if value is UNKNOWN or value is not None and "url(" in value:
+            return None
+
+    a, b, c, d, e, f = matrix
+    decimals = DECIMALS if precision is None else precision
+    attrs = dict(attrs)
+    del attrs["transform"]
+
+    stroke = properties.get("stroke")
+    if stroke is not None and stroke.strip() != "none":
+        # Only uniform scales (with rotations and reflections) scale strokes like we can
+        squared_scale = a * a + b * b
+        tolerance = TOLERANCE * max(1.0, squared_scale)
+        if abs(a * c + b * d) > tolerance or abs(c * c + d * d - squared_scale) > tolerance:
+            return None
+        scale = math.sqrt(squared_scale)
+        if abs(scale - 1.0) > TOLERANCE:
+            if not _scale_stroke(attrs, properties, scale, decimals):
+                return None
+
+    def transform(x, y):
+        return a * x + c * y + e, b * x + d * y + f
+
+    if tag == "path":
+        segments = _absolute_segments(attrs.get("d", ""), translation_only=(a, b, c, d) == (1.0, 0.0, 0.0, 1.0))
+        if segments is None:
+            return None
+        segments = [(command, values, [transform(x, y) for x, y in points]) for command, values, points in segments]
+        attrs["d"] = _path_data(segments, DECIMALS)
+        if precision is not None:
+            attrs["d"] = optimize_path_data(attrs["d"], precision)
+        return attrs
+
+    numbers = [float(number) for number in NUMBER.findall(attrs.get("points", ""))]
+    if not numbers or len(numbers) % 2:
+        return None
+    points = [transform(x, y) for x, y in zip(numbers[::2], numbers[1::2])]
+    attrs["points"] = " ".join(format_number(value, decimals) for point in points for value in point)
+    return attrs
+
+
+def _scale_stroke(attrs, properties, scale, decimals):
+    """Scale the (inherited) stroke width and dashes of an element, or return False if they can't be read."""
+    width = properties.get("stroke-width", "1")
+    if width is UNKNOWN or not PLAIN_NUMBER.match(width):
+        return False
+    attrs["stroke-width"] = format_non_zero(float(width) * scale, decimals)
+
+    dashes = properties.get("stroke-dasharray")
+    if dashes is not None and dashes.strip() != "none":
+        if dashes is UNKNOWN or not DASH_ARRAY.match(dashes):
+            return False
+        attrs["stroke-dasharray"] = ",".join(
+            format_number(float(dash) * scale, decimals) for dash in NUMBER.findall(dashes)
+        )
+        offset = properties.get("stroke-dashoffset")
+        if offset is not None:
+            if offset is UNKNOWN or not PLAIN_NUMBER.match(offset):
+                return False
+            attrs["stroke-dashoffset"] = format_number(float(offset) * scale, decimals)
+    return True
+
+
+def _absolute_segments(d, translation_only):
+    """
+    The segments of path data as (command, values, points): absolute commands, the values that are
+    not points (of arcs) and the points. None if the path can't be folded.
+    """
+    segments = parse_path_data(d)
+    if segments is None:
+        return None
+
+    absolute = []
+    x = y = start_x = start_y = 0.0
+    for command, values in segments:
+        upper = command.upper()
+        relative = command != upper
+        if upper == "Z":
+            absolute.append(("Z", [], []))
+            x, y = start_x, start_y
+            continue
+        if upper in "HV":
+            if upper == "H":
+                x = values[0] + x if relative else values[0]
+            else:
+                y = values[0] + y if relative else values[0]
+            # Horizontal and vertical lines stay that in translations, otherwise they become lines
+            absolute.append((upper if translation_only else "L", [], [(x, y)]))
+            continue
+        if upper == "A":
+            if not translation_only:
+                return None
+            end = (values[5] + x, values[6] + y) if relative else (values[5], values[6])
+            absolute.append(("A", values[:5], [end]))
+            x, y = end
+            continue
+
+        segment_points = []
+        for i in range(0, len(values), 2):
+            point = (values[i] + x, values[i + 1] + y) if relative else (values[i], values[i + 1])
+            segment_points.append(point)
+        absolute.append((upper, [], segment_points))
+        x, y = segment_points[-1]
+        if upper == "M":
+            start_x, start_y = x, y
+    return absolute
+
+
+def _path_data(segments, decimals):
+    """Path data for segments like the ones from `_absolute_segments`."""
+    output = []
+    for command, values, transformed in segments:
+        if command == "H":
+            numbers = [format_number(transformed[0][0], decimals)]
+        elif command == "V":
+            numbers = [format_number(transformed[0][1], decimals)]
+        elif command == "A":
+            numbers = [format_number(value, decimals) for value in values[:3]]
+            numbers += ["1" if values[3] else "0", "1" if values[4] else "0"]
+            numbers += [format_number(value, decimals) for value in transformed[0]]
+        else:
+            numbers = [format_number(value, decimals) for point in transformed for value in point]
+        output.append(command + join_numbers(numbers))
+    return "".join(output)
+
+
+def _start_tag(tag, attrs):
+    """The start tag of an element without its closing `>` or `/>`."""
+    return f"<{tag}{serialize_attributes(attrs)}"
@@ -0,0 +1,130 @@
+"""
+Debounced, cancellable rebuilds for the --watch modes of both scripts.
+
+Editors (and Sketch/Figma exports) write many files at once. Instead of rebuilding
+for every file system event on the watchdog thread, events are collected by a
+`RebuildScheduler`. It waits until no new changes arrived for a short while, and then
+runs one build for all changed paths on its own thread. If more changes come in
+while a build runs, that build is cancelled and a new one starts with all changed paths.
+"""
+
+import threading
+import time
+import traceback
+
+
+class BuildCancelled(Exception):
+    """Raised by a build that noticed its cancel event was set."""
+
+
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise BuildCancelled()
+
+
+class RebuildScheduler:
+    """
+    Calls `build(changed_paths, cancel)` on a background thread, `debounce` seconds
+    after the last change. `cancel` is a threading.Event that is set when newer changes arrive;
+    builds should call `check_cancelled(cancel)` regularly.
+    """
+
+    def __init__(self, build, debounce=0.3):
+        self.build = build
+        self.debounce = debounce
+        self._condition = threading.Condition()
+        self._pending = set()
+        self._last_change = 0.0
+        self._cancel = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="rebuild-scheduler", daemon=True)
+        self._thread.start()
+
+    def notify(self, path):
+        with self._condition:
+            self._pending.add(path)
+            self._last_change = time.monotonic()
+            if self._cancel is not None:
+                self._cancel.set()
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            if self._cancel is not None:
+                self._cancel.set()
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and not self._pending:
+                    self._condition.wait()
+                # Wait until the changes stop coming in
+                while not self._stopped:
+                    remaining = self._last_change + self.debounce - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped:
+                    return
+                changed_paths, self._pending = self._pending, set()
+                cancel = self._cancel = threading.Event()
+
+            print(f"\n\nDetected change in {', '.join(sorted(changed_paths))}. Re-building.\n")
+            try:
+                self.build(changed_paths, cancel)
+            except BuildCancelled:
+                print("\nBuild cancelled, newer changes came in.\n")
+                with self._condition:
+                    self._pending |= changed_paths
+            except Exception:
+                # Keep watching, the next save may fix the problem
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._cancel = None
+
+
+# watchdog's event types. Builds read the watched files themselves,
+# so "opened"/"closed" events must not trigger a rebuild.
+CHANGE_EVENTS = {"created", "deleted", "modified", "moved"}
+
+
+class ChangeHandler:
+    """
+    Forwards the paths of file system events that match `predicate` to a scheduler.
+    watchdog only calls `dispatch`, so this does not need to subclass its FileSystemEventHandler,
+    and watchdog is only imported once something is watched.
+    """
+
+    def __init__(self, scheduler, predicate):
+        self.scheduler = scheduler
+        self.predicate = predicate
+
+    def dispatch(self, event):
+        if event.is_directory or event.event_type not in CHANGE_EVENTS:
+            return
+        paths = [event.src_path]
+        if event.event_type == "moved":
+            paths.append(event.dest_path)
+        for path in paths:
+            if self.predicate(path):
+                self.scheduler.notify(path)
+
+
+def watch(directory, scheduler, predicate, recursive=True):
+    """Watch `directory` until Ctrl+C, and schedule rebuilds for changed paths that match `predicate`."""
+    from watchdog.observers import Observer
+
+    observer = Observer()
+    observer.schedule(ChangeHandler(scheduler, predicate), str(directory), recursive=recursive)
+    observer.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        observer.stop()
+    observer.join()
+    scheduler.stop()